@@ -0,0 +1,84 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from fps import map as game_map
+from fps.map import make_map, set_map, spawn_layout
+from fps.raycaster import visibility
+from fps.entities import AIScheduler, EnemyPool, Player
+
+def run_count(enemy_count, map_size, seed, ticks, warmup, budget_ms):
+    grid = make_map(map_size, seed)
+    set_map(grid, spawn_layout(grid, enemy_count, seed))
+    visibility.ensure()
+
+    results = {}
+    for mode in ("all", "scheduled"):
+        player = Player(*game_map.level.player_start)
+        enemies = EnemyPool.from_positions(game_map.level.spawns)
+        scheduler = AIScheduler(budget_ms=budget_ms) if mode == "scheduled" else None
+        times = []
+        updated = np.zeros(len(AIScheduler.TIERS), dtype=np.int64)
+        for tick in range(warmup + ticks):
+            # The player is only a target here; keep them alive whatever the enemies do.
+            player.health = 100
+            enemies.begin_tick()
+            start = time.perf_counter()
+            if scheduler:
+                scheduler.step(enemies, player)
+            else:
+                enemies.step(player)
+            if tick >= warmup:
+                times.append((time.perf_counter() - start) * 1000)
+                if scheduler:
+                    updated += scheduler.updated
+        times = np.array(times)
+        results[mode] = {
+            "ai_mean_ms": float(times.mean()),
+            "ai_p95_ms": float(np.percentile(times, 95)),
+            "updates_per_tick": ({name: float(count) / ticks for (name, _, _), count in zip(scheduler.tiers, updated)}
+                                 if scheduler else {"all": float(enemy_count)}),
+        }
+    return {"enemies": enemy_count, "pvs_build_ms": visibility.build_ms, "pvs_rows_built": visibility.rows_built,
+            "modes": results}
+
+def run(counts=(100, 1000, 5000, 20000), map_size=256, seed=0, ticks=300, warmup=30, budget_ms=2.0):
+    return {
+        "params": {
+            "map_size": map_size,
+            "seed": seed,
+            "ticks": ticks,
+            "warmup": warmup,
+            "budget_ms": budget_ms,
+            "tiers": [list(tier) for tier in AIScheduler.TIERS],
+        },
+        "results": [run_count(count, map_size, seed, ticks, warmup, budget_ms) for count in counts],
+    }
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Enemy AI cost with and without the tiered scheduler")
+    parser.add_argument("--counts", type=int, nargs="+", default=[100, 1000, 5000, 20000])
+    parser.add_argument("--map-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ticks", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=30)
+    parser.add_argument("--budget-ms", type=float, default=2.0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    result = run(args.counts, args.map_size, args.seed, args.ticks, args.warmup, args.budget_ms)
+    for stats in result["results"]:
+        every = stats["modes"]["all"]
+        scheduled = stats["modes"]["scheduled"]
+        tiers = "  ".join(f"{name} {count:.1f}" for name, count in scheduled["updates_per_tick"].items())
+        print(f"{stats['enemies']:6d} enemies  all {every['ai_mean_ms']:7.2f} ms  "
+              f"scheduled {scheduled['ai_mean_ms']:6.2f} ms (p95 {scheduled['ai_p95_ms']:5.2f})  per tick: {tiers}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,227 @@
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import math
+import random
+import time
+
+import numpy as np
+import pygame
+
+from fps import map as game_map
+from fps.app import FRAME_STAGES, Game, init
+from fps.constants import FPS
+from fps.input import KeyState
+from fps.profiler import profiler
+from fps.map import load_level, make_map, set_map, spawn_layout
+from fps.raycaster import VisibilityTable, visibility
+from fps.entities import Enemy, EnemyList, EnemyPool, Player
+from fps.rendering import AdaptiveResolution, DisplayConfig, close_render_pools, sprite_atlas
+from fps.ui import compositor, text_cache
+
+STAGES = list(FRAME_STAGES) + ["frame"]
+
+class InputScript:
+    def __init__(self, display, seed=0):
+        self.display = display
+        self.rng = random.Random(seed)
+        self.keys = KeyState()
+
+    def frame(self, index):
+        self.keys.pressed = {pygame.K_w}
+        if (index // 90) % 2:
+            self.keys.pressed.add(pygame.K_a)
+        if (index // 240) % 3 == 2:
+            self.keys.pressed = {pygame.K_s}
+
+        events = [pygame.event.Event(pygame.MOUSEMOTION, rel=(int(8 * math.sin(index / 20)), 0))]
+        if index % 30 == 0:
+            events.append(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_SPACE))
+
+        width, height = self.display.width, self.display.height
+        if index % 120 == 0:
+            events.append(pygame.event.Event(pygame.FINGERDOWN, finger_id=1, x=0.2, y=0.7))
+        elif index % 120 == 60:
+            events.append(pygame.event.Event(pygame.FINGERUP, finger_id=1, x=0.2, y=0.7))
+        elif index % 120 < 60:
+            events.append(pygame.event.Event(pygame.FINGERMOTION, finger_id=1,
+                                             x=0.2 + self.rng.uniform(-0.03, 0.03),
+                                             y=0.7 + self.rng.uniform(-0.03, 0.03)))
+        if index % 45 == 0:
+            button_x = (width - 60) / width
+            button_y = (height - 60) / height
+            events.append(pygame.event.Event(pygame.FINGERDOWN, finger_id=2, x=button_x, y=button_y))
+        return events
+
+def run(width=800, height=600, num_rays=None, map_size=10, enemy_count=5, frames=300,
+        warmup=30, seed=0, render_mode="numpy", enemy_store="pool", adaptive_ms=None,
+        workers=None, level_path=None, textured=True, trace_path=None):
+    load_start = time.perf_counter()
+    if level_path:
+        load_level(level_path)
+    else:
+        set_map(make_map(map_size, seed))
+
+    display = DisplayConfig()
+    display.render_mode = render_mode
+    if workers:
+        display.render_workers = workers
+    display.update(width, height)
+    if num_rays:
+        display.num_rays = num_rays
+        display.delta_angle = display.fov / display.num_rays
+    display.textured = textured
+    if adaptive_ms:
+        display.resolution = AdaptiveResolution(target_ms=adaptive_ms)
+    screen = pygame.display.set_mode((display.width, display.height))
+
+    player = Player(*game_map.level.player_start)
+    if level_path:
+        # A level brings its own spawns; scanning a huge map for floor would swamp the load time.
+        spawns = game_map.level.spawns[:enemy_count]
+    else:
+        spawns = spawn_layout(game_map.level.to_array(), enemy_count, seed)
+    if enemy_store == "pool":
+        enemies = EnemyPool.from_positions(spawns)
+    else:
+        enemies = EnemyList(Enemy(x, y) for x, y in spawns)
+    visibility.ensure(VisibilityTable.cache_path_for(level_path) if level_path else None)
+    load_ms = (time.perf_counter() - load_start) * 1000
+    game = Game(screen, display, player, enemies)
+    script = InputScript(display, seed)
+    if trace_path:
+        profiler.start_trace(trace_path)
+    profiler.collect()
+
+    samples = {}
+    for index in range(warmup + frames):
+        # The player is only a target here; keep them alive whatever the enemies do.
+        player.health = 100
+        events = script.frame(index)
+        pygame.event.pump()
+        start = time.perf_counter()
+        game.frame(events, script.keys, 1 / FPS)
+        if display.resolution:
+            display.resolution.record((time.perf_counter() - start) * 1000)
+
+        # One sample per stage per frame, however many times the stage ran in it.
+        for stage, values in profiler.timings.items():
+            if values and index >= warmup:
+                samples.setdefault(stage, []).append(sum(values))
+            values.clear()
+
+    profiler.collect(False)
+    profiler.stop_trace()
+    close_render_pools()
+    
+    stages = {}
+    for stage in sorted(samples, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES)):
+        values = np.array(samples[stage])
+        stages[stage] = {
+            "mean_ms": float(values.mean()),
+            "p50_ms": float(np.percentile(values, 50)),
+            "p95_ms": float(np.percentile(values, 95)),
+            "p99_ms": float(np.percentile(values, 99)),
+        }
+
+    return {
+        "params": {
+            "width": display.width,
+            "height": display.height,
+            "num_rays": display.num_rays,
+            "map_size": max(game_map.level.width, game_map.level.height),
+            "level": level_path,
+            "enemies": len(spawns),
+            "frames": frames,
+            "seed": seed,
+            "render_mode": render_mode,
+            "enemy_store": enemy_store,
+            "adaptive_ms": adaptive_ms,
+            "workers": display.render_workers,
+            "textured": textured,
+        },
+        "load": {
+            "total_ms": load_ms,
+            "pvs_build_ms": visibility.build_ms,
+        },
+        "stages": stages,
+        "counters": {
+            "text_cache_hits": text_cache.hits,
+            "text_cache_misses": text_cache.misses,
+            "sprite_cache_hits": sprite_atlas.hits,
+            "sprite_cache_misses": sprite_atlas.misses,
+            "sprite_cache_evictions": sprite_atlas.evictions,
+            "sprite_cache_bytes": sprite_atlas.bytes,
+            "pvs_culled": visibility.culled,
+            "pvs_exact_checks": visibility.exact_checks,
+            "pvs_rows_built": visibility.rows_built,
+            "full_frames": compositor.full_frames,
+            "partial_frames": compositor.partial_frames,
+            "render_scale": display.render_scale(),
+        },
+    }
+
+def compare(result, baseline, tolerance=0.10):
+    regressions = []
+    for stage, stats in result["stages"].items():
+        if stage not in baseline["stages"]:
+            continue
+        before = baseline["stages"][stage]["p95_ms"]
+        after = stats["p95_ms"]
+        if before > 0 and after > before * (1 + tolerance):
+            regressions.append((stage, before, after))
+    return regressions
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Headless frame-time benchmark")
+    parser.add_argument("--width", type=int, default=800)
+    parser.add_argument("--height", type=int, default=600)
+    parser.add_argument("--rays", type=int, default=None)
+    parser.add_argument("--map-size", type=int, default=10)
+    parser.add_argument("--level", default=None, help="binary level file to load instead of a generated map")
+    parser.add_argument("--enemies", type=int, default=5)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--render-mode", choices=["numpy", "parallel", "python"], default="numpy")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--flat", action="store_true", help="flat-shaded walls instead of textures")
+    parser.add_argument("--enemy-store", choices=["pool", "list"], default="pool")
+    parser.add_argument("--adaptive-ms", type=float, default=None)
+    parser.add_argument("--trace", default=None, help="write a Chrome trace-event JSON file")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    init()
+    result = run(args.width, args.height, args.rays, args.map_size, args.enemies,
+                 args.frames, args.warmup, args.seed, args.render_mode, args.enemy_store,
+                 args.adaptive_ms, args.workers, args.level, not args.flat, args.trace)
+
+    print(f"{'level_load':14s} {result['load']['total_ms']:8.3f} ms  (pvs {result['load']['pvs_build_ms']:.3f} ms)")
+    for stage, stats in result["stages"].items():
+        print(f"{stage:14s} p50 {stats['p50_ms']:8.3f} ms  p95 {stats['p95_ms']:8.3f} ms  "
+              f"p99 {stats['p99_ms']:8.3f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.tolerance)
+        for stage, before, after in regressions:
+            print(f"REGRESSION {stage}: p95 {before:.3f} ms -> {after:.3f} ms")
+        if regressions:
+            raise SystemExit(1)
+
+    pygame.quit()
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,314 @@
+import os
+import math
+import multiprocessing
+from collections import OrderedDict
+
+import numpy as np
+
+from fps import map as game_map
+from fps.constants import FPS, MAX_DEPTH, TICK_RATE
+from fps.map import load_level
+from fps.input import (FORWARD, BACKWARD, STRAFE_LEFT, STRAFE_RIGHT, TURN_LEFT, TURN_RIGHT, FIRE,
+                       TURN_SPEED, action_keys)
+from fps.raycaster import trace_rays
+from fps.entities import EnemyPool, FlowField, Player, shoot
+from fps.simulation import Simulation
+
+KILL_REWARD = 1.0
+DAMAGE_PENALTY = 0.01
+
+def view_angles(angle, rays, fov=math.pi / 3):
+    return angle + np.linspace(-fov / 2, fov / 2, rays)
+
+def depth_observation(origin_x, origin_y, angle, rays):
+    """Perpendicular wall depth per ray, scaled to [0, 1]. All arguments may be per-instance arrays."""
+    origin_x = np.atleast_1d(origin_x)
+    origin_y = np.atleast_1d(origin_y)
+    angles = view_angles(np.atleast_1d(angle)[:, None], rays)
+    depth = trace_rays(np.repeat(origin_x, rays), np.repeat(origin_y, rays),
+                       np.cos(angles).ravel(), np.sin(angles).ravel())[0]
+    depth = depth.reshape(len(origin_x), rays) * np.cos(angles - np.atleast_1d(angle)[:, None])
+    return (depth / MAX_DEPTH).astype(np.float32)
+
+class GameEnv:
+    """One game instance behind a reset/step interface.
+
+    Actions are bitmasks of FORWARD, BACKWARD, STRAFE_LEFT, STRAFE_RIGHT,
+    TURN_LEFT, TURN_RIGHT and FIRE. Observations are a dict with a `state`
+    vector (x, y, cos, sin, health, ammo, enemies left) and, when `rays` is
+    set, a `depth` row cast from the player's view.
+    """
+
+    def __init__(self, rays=0, tick_rate=TICK_RATE, max_ticks=3600):
+        self.rays = rays
+        self.tick_rate = tick_rate
+        self.max_ticks = max_ticks
+        self.simulation = None
+
+    def reset(self):
+        player = Player(*game_map.level.player_start)
+        enemies = EnemyPool.from_positions(game_map.level.spawns)
+        self.simulation = Simulation(player, enemies, self.tick_rate)
+        return self.observe()
+
+    def observe(self):
+        player = self.simulation.player
+        enemies = self.simulation.enemies
+        state = np.array([player.x, player.y, math.cos(player.angle), math.sin(player.angle),
+                          player.health / 100, player.ammo / 100,
+                          enemies.alive_count() / max(len(enemies), 1)], dtype=np.float32)
+        observation = {'state': state}
+        if self.rays:
+            observation['depth'] = depth_observation(player.x, player.y, player.angle, self.rays)[0]
+        return observation
+
+    def step(self, action):
+        simulation = self.simulation
+        player = simulation.player
+        enemies = simulation.enemies
+        health = player.health
+        alive = enemies.alive_count()
+
+        if action & FIRE:
+            shoot(player, enemies)
+        turn = bool(action & TURN_RIGHT) - bool(action & TURN_LEFT)
+        if turn:
+            player.angle = (player.angle + turn * TURN_SPEED * simulation.time_scale) % (2 * math.pi)
+        simulation.step(action_keys(action))
+
+        kills = alive - enemies.alive_count()
+        reward = kills * KILL_REWARD - (health - player.health) * DAMAGE_PENALTY
+        done = simulation.finished or simulation.tick >= self.max_ticks
+        info = {'tick': simulation.tick, 'victory': simulation.victory, 'game_over': simulation.game_over}
+        return self.observe(), reward, done, info
+
+class VectorEnv:
+    """`num_envs` independent games stepped in lockstep on (instance, enemy) arrays.
+
+    Follows the same rules as GameEnv, one array operation per rule instead
+    of one Python call per entity. Finished instances reset themselves; the
+    `done` flags returned by step() mark them.
+    """
+
+    def __init__(self, num_envs, rays=0, tick_rate=TICK_RATE, max_ticks=3600, max_flow_fields=256):
+        self.num_envs = num_envs
+        self.rays = rays
+        self.tick_rate = tick_rate
+        self.time_scale = FPS / tick_rate
+        self.max_ticks = max_ticks
+        self.spawns = np.array(game_map.level.spawns, dtype=np.float32).reshape(-1, 2)
+        # One field per player tile, least recently used dropped first.
+        self.flow_fields = OrderedDict()
+        self.max_flow_fields = max_flow_fields
+
+        count = len(self.spawns)
+        self.x = np.zeros(num_envs)
+        self.y = np.zeros(num_envs)
+        self.angle = np.zeros(num_envs)
+        self.health = np.zeros(num_envs, dtype=np.int64)
+        self.ammo = np.zeros(num_envs, dtype=np.int64)
+        self.tick = np.zeros(num_envs, dtype=np.int64)
+        self.enemy_x = np.zeros((num_envs, count), dtype=np.float32)
+        self.enemy_y = np.zeros((num_envs, count), dtype=np.float32)
+        self.enemy_health = np.zeros((num_envs, count), dtype=np.int16)
+        self.alive = np.zeros((num_envs, count), dtype=bool)
+        self.speed = np.float32(0.02)
+        self.damage = 10
+        self.cooldown = np.zeros((num_envs, count), dtype=np.float32)
+
+    def reset(self, mask=None):
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=bool)
+        self.x[mask], self.y[mask] = game_map.level.player_start
+        self.angle[mask] = 0
+        self.health[mask] = 100
+        self.ammo[mask] = 100
+        self.tick[mask] = 0
+        self.enemy_x[mask] = self.spawns[:, 0]
+        self.enemy_y[mask] = self.spawns[:, 1]
+        self.enemy_health[mask] = 50
+        self.alive[mask] = True
+        self.cooldown[mask] = 0
+        return self.observe()
+
+    def observe(self):
+        state = np.stack([self.x, self.y, np.cos(self.angle), np.sin(self.angle),
+                          self.health / 100, self.ammo / 100,
+                          self.alive.sum(axis=1) / max(self.alive.shape[1], 1)], axis=1).astype(np.float32)
+        observation = {'state': state}
+        if self.rays:
+            observation['depth'] = depth_observation(self.x, self.y, self.angle, self.rays)
+        return observation
+
+    def fire(self, firing):
+        firing &= self.ammo > 0
+        self.ammo[firing] -= 1
+
+        dx = self.enemy_x - self.x[:, None]
+        dy = self.enemy_y - self.y[:, None]
+        distance = np.sqrt(dx**2 + dy**2)
+        angle_diff = (np.arctan2(dy, dx) - self.angle[:, None] + math.pi) % (2 * math.pi) - math.pi
+        target = firing[:, None] & self.alive & (distance < 10) & (np.abs(angle_diff) < 0.1)
+
+        env, enemy = np.nonzero(target & (distance > 0))
+        if env.size:
+            reach = distance[env, enemy]
+            depth = trace_rays(self.x[env], self.y[env], dx[env, enemy] / reach, dy[env, enemy] / reach, reach)[0]
+            target[env, enemy] = depth >= reach
+
+        nearest = np.argmin(np.where(target, distance, np.inf), axis=1)
+        hit = np.flatnonzero(target.any(axis=1))
+        self.enemy_health[hit, nearest[hit]] -= 25
+        self.alive &= self.enemy_health > 0
+
+    def move_players(self, actions):
+        forward = ((actions & FORWARD) > 0).astype(np.float64) - ((actions & BACKWARD) > 0)
+        side = ((actions & STRAFE_RIGHT) > 0).astype(np.float64) - ((actions & STRAFE_LEFT) > 0)
+        step = Player(0, 0).speed * self.time_scale
+        move_x = forward * np.cos(self.angle) + side * np.cos(self.angle + math.pi / 2)
+        move_y = forward * np.sin(self.angle) + side * np.sin(self.angle + math.pi / 2)
+        new_x = self.x + move_x * step
+        new_y = self.y + move_y * step
+
+        map_x = new_x.astype(np.int64)
+        map_y = new_y.astype(np.int64)
+        ok = (new_x >= 0) & (new_y >= 0) & (map_x < game_map.level.width) & (map_y < game_map.level.height)
+        ok[ok] = game_map.level.tiles(map_x[ok], map_y[ok]) == 0
+        near = (self.enemy_x - new_x[:, None])**2 + (self.enemy_y - new_y[:, None])**2 < 0.3**2
+        ok &= ~(near & self.alive).any(axis=1)
+        self.x[ok] = new_x[ok]
+        self.y[ok] = new_y[ok]
+
+    def waypoints(self, env, x, y):
+        """Flow-field waypoints for enemies `x`, `y` chasing the player of instance `env`."""
+        tile_x = self.x.astype(np.int64)
+        tile_y = self.y.astype(np.int64)
+        waypoint_x = np.empty(len(env))
+        waypoint_y = np.empty(len(env))
+        tiles = tile_y[env] * game_map.level.width + tile_x[env]
+        for tile in np.unique(tiles):
+            group = tiles == tile
+            field = self.flow_fields.get(tile)
+            if field is None:
+                field = self.flow_fields[tile] = FlowField()
+                if len(self.flow_fields) > self.max_flow_fields:
+                    self.flow_fields.popitem(last=False)
+            else:
+                self.flow_fields.move_to_end(tile)
+            field.update(Player(self.x[env[group][0]], self.y[env[group][0]]))
+            waypoint_x[group], waypoint_y[group] = field.lookup(x[group], y[group], self.x[env[group]], self.y[env[group]])
+        return waypoint_x, waypoint_y
+
+    def move_enemies(self):
+        dx = self.x[:, None] - self.enemy_x
+        dy = self.y[:, None] - self.enemy_y
+        dist = np.sqrt(dx**2 + dy**2)
+
+        moving = self.alive & (dist > 0.3)
+        env, enemy = np.nonzero(moving)
+        x = self.enemy_x[env, enemy]
+        y = self.enemy_y[env, enemy]
+        waypoint_x, waypoint_y = self.waypoints(env, x, y)
+        steer_x = waypoint_x - x
+        steer_y = waypoint_y - y
+        step = np.sqrt(steer_x**2 + steer_y**2)
+        arrived = step == 0
+        steer_x[arrived] = dx[env, enemy][arrived]
+        steer_y[arrived] = dy[env, enemy][arrived]
+        step[arrived] = dist[env, enemy][arrived]
+        new_x = (x + steer_x / step * self.speed * np.float32(self.time_scale)).astype(np.float32)
+        new_y = (y + steer_y / step * self.speed * np.float32(self.time_scale)).astype(np.float32)
+
+        map_x = new_x.astype(np.int64)
+        map_y = new_y.astype(np.int64)
+        ok = (new_x >= 0) & (new_y >= 0) & (map_x < game_map.level.width) & (map_y < game_map.level.height)
+        ok[ok] = game_map.level.tiles(map_x[ok], map_y[ok]) == 0
+        others = self.alive[env].copy()
+        others[np.arange(len(env)), enemy] = False
+        crowd = (self.enemy_x[env] - new_x[:, None])**2 + (self.enemy_y[env] - new_y[:, None])**2 < 0.3**2
+        ok &= ~(crowd & others).any(axis=1)
+        self.enemy_x[env[ok], enemy[ok]] = new_x[ok]
+        self.enemy_y[env[ok], enemy[ok]] = new_y[ok]
+
+        attacking = self.alive & ~moving & (self.cooldown <= 0)
+        self.health -= attacking.sum(axis=1) * self.damage
+        self.cooldown[attacking] = 60
+        cooling = self.alive & (self.cooldown > 0)
+        self.cooldown[cooling] -= self.time_scale
+
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=np.int64)
+        health = self.health.copy()
+        alive = self.alive.sum(axis=1)
+
+        self.fire((actions & FIRE) > 0)
+        turn = ((actions & TURN_RIGHT) > 0).astype(np.float64) - ((actions & TURN_LEFT) > 0)
+        self.angle = (self.angle + turn * TURN_SPEED * self.time_scale) % (2 * math.pi)
+        self.move_players(actions)
+        self.move_enemies()
+        self.tick += 1
+
+        kills = alive - self.alive.sum(axis=1)
+        reward = kills * KILL_REWARD - (health - self.health) * DAMAGE_PENALTY
+        victory = ~self.alive.any(axis=1)
+        game_over = self.health <= 0
+        done = victory | game_over | (self.tick >= self.max_ticks)
+        info = {'tick': self.tick.copy(), 'victory': victory, 'game_over': game_over}
+        if done.any():
+            self.reset(done)
+        return self.observe(), reward, done, info
+
+def vector_worker(connection, level_path, num_envs, kwargs):
+    if level_path:
+        load_level(level_path)
+    env = VectorEnv(num_envs, **kwargs)
+    while True:
+        command, data = connection.recv()
+        if command == 'reset':
+            connection.send(env.reset())
+        elif command == 'step':
+            connection.send(env.step(data))
+        else:
+            connection.close()
+            return
+
+def concatenate(parts):
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+class ProcessVectorEnv:
+    """Splits `num_envs` instances into one VectorEnv per worker process."""
+
+    def __init__(self, num_envs, workers=None, level_path=None, **kwargs):
+        workers = max(1, min(workers or os.cpu_count() or 1, num_envs))
+        self.num_envs = num_envs
+        self.bounds = np.linspace(0, num_envs, workers + 1).astype(int)
+        context = multiprocessing.get_context('spawn')
+        self.connections = []
+        self.processes = []
+        for first, last in zip(self.bounds[:-1], self.bounds[1:]):
+            parent, child = context.Pipe()
+            process = context.Process(target=vector_worker, args=(child, level_path, last - first, kwargs), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+
+    def reset(self):
+        for connection in self.connections:
+            connection.send(('reset', None))
+        return concatenate([connection.recv() for connection in self.connections])
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        for connection, first, last in zip(self.connections, self.bounds[:-1], self.bounds[1:]):
+            connection.send(('step', actions[first:last]))
+        results = [connection.recv() for connection in self.connections]
+        observations, rewards, dones, infos = zip(*results)
+        return (concatenate(observations), np.concatenate(rewards), np.concatenate(dones),
+                concatenate(infos))
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(('close', None))
+        for process in self.processes:
+            process.join()
@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+import env
+from fps.input import NUM_ACTIONS
+from fps.map import load_level
+
+def random_actions(rng, steps, num_envs):
+    # Mostly forward with random turning, strafing and firing.
+    actions = rng.integers(0, NUM_ACTIONS, (steps, num_envs))
+    return (actions & ~env.BACKWARD) | env.FORWARD
+
+def run_single(num_envs, steps, rays, seed):
+    actions = random_actions(np.random.default_rng(seed), steps, num_envs)
+    instances = [env.GameEnv(rays=rays) for _ in range(num_envs)]
+    for instance in instances:
+        instance.reset()
+
+    start = time.perf_counter()
+    for row in actions:
+        for instance, action in zip(instances, row):
+            if instance.step(int(action))[2]:
+                instance.reset()
+    return time.perf_counter() - start
+
+def run_vector(num_envs, steps, rays, seed):
+    actions = random_actions(np.random.default_rng(seed), steps, num_envs)
+    vector = env.VectorEnv(num_envs, rays=rays)
+    vector.reset()
+
+    start = time.perf_counter()
+    for row in actions:
+        vector.step(row)
+    return time.perf_counter() - start
+
+def run_process(num_envs, steps, rays, seed, workers, level_path):
+    actions = random_actions(np.random.default_rng(seed), steps, num_envs)
+    vector = env.ProcessVectorEnv(num_envs, workers, level_path, rays=rays)
+    vector.reset()
+
+    start = time.perf_counter()
+    for row in actions:
+        vector.step(row)
+    elapsed = time.perf_counter() - start
+    vector.close()
+    return elapsed
+
+def run(num_envs=64, steps=500, rays=0, seed=0, workers=None, level_path=None, modes=("single", "vector", "process")):
+    if level_path:
+        load_level(level_path)
+
+    results = {}
+    for mode in modes:
+        if mode == "single":
+            elapsed = run_single(num_envs, steps, rays, seed)
+        elif mode == "vector":
+            elapsed = run_vector(num_envs, steps, rays, seed)
+        else:
+            elapsed = run_process(num_envs, steps, rays, seed, workers, level_path)
+        results[mode] = {
+            "seconds": elapsed,
+            "env_steps_per_second": num_envs * steps / elapsed,
+        }
+
+    return {
+        "params": {
+            "num_envs": num_envs,
+            "steps": steps,
+            "rays": rays,
+            "seed": seed,
+            "workers": workers or os.cpu_count() or 1,
+            "level": level_path,
+        },
+        "modes": results,
+    }
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Environment throughput benchmark")
+    parser.add_argument("--envs", type=int, default=64)
+    parser.add_argument("--steps", type=int, default=500)
+    parser.add_argument("--rays", type=int, default=0, help="depth observation rays per instance (0 = state only)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--level", default=None)
+    parser.add_argument("--modes", nargs="+", choices=["single", "vector", "process"],
+                        default=["single", "vector", "process"])
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    result = run(args.envs, args.steps, args.rays, args.seed, args.workers, args.level, args.modes)
+    for mode, stats in result["modes"].items():
+        print(f"{mode:8s} {stats['env_steps_per_second']:12.0f} env-steps/s  ({stats['seconds']:.2f} s)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1 @@
+"""Raycasting FPS. Everything but rendering, ui and app imports without pygame."""
@@ -0,0 +1,225 @@
+import pygame
+import os
+import time
+
+from . import map as game_map
+from .constants import FPS, GREEN, QUICKSAVE_PATH, RED, REWIND_MEMORY, REWIND_SECONDS, TICK_RATE, YELLOW
+from .entities import AIScheduler, EnemyPool, Player, flow_field, shoot
+from .map import load_level
+from .profiler import profiler
+from .raycaster import VisibilityTable, visibility
+from .rendering import AdaptiveResolution, DisplayConfig, close_render_pools, render_3d, render_counters, sprite_atlas
+from .simulation import Simulation, SnapshotRing, load_world, save_world
+from .ui import (TouchControl, compositor, minimap_layer, profiler_overlay, scene_key, text_cache,
+                 update_end_screen, update_hud, update_message)
+
+# Profiler stages of one Game.frame(), in order; 'player_move' and 'enemies' come from Simulation.step.
+FRAME_STAGES = ("events", "touch_update", "player_move", "enemies", "history", "render_3d",
+                "draw_minimap", "draw_hud", "touch_draw", "present")
+
+def init():
+    """Bring up the display; fonts start on first use and audio is never needed."""
+    pygame.display.init()
+
+class Game:
+    """A running game and its frame: events, fixed-rate ticks, rewind history, drawing.
+    
+    main() feeds it pygame's events, keys and clock; benchmark.py feeds it a
+    script, so both time the same path.
+    """
+    
+    def __init__(self, screen, display, player, enemies, resizable=False):
+        self.screen = screen
+        self.display = display
+        self.resizable = resizable
+        self.player = player
+        self.enemies = enemies
+        self.simulation = Simulation(player, enemies, TICK_RATE, AIScheduler())
+        # Snapshots pack the pool's columns, so an EnemyList world has no rewind.
+        self.history = None
+        if isinstance(enemies, EnemyPool):
+            self.history = SnapshotRing(REWIND_SECONDS * TICK_RATE, max_enemies=max(len(enemies), 1),
+                                        max_bytes=REWIND_MEMORY)
+            self.history.push(self.simulation)
+        self.touch_control = TouchControl()
+        self.accumulator = 0.0
+        self.running = True
+        self.message = None
+        self.message_color = YELLOW
+        self.message_until = 0.0
+    
+    def notify(self, text, color=YELLOW, seconds=3.0):
+        self.message = text
+        self.message_color = color
+        self.message_until = time.perf_counter() + seconds
+    
+    def quicksave(self):
+        # Saves pack the pool's columns, like rewind snapshots.
+        if self.history is None:
+            self.notify("Save failed: this world cannot be saved", RED)
+            return
+        try:
+            save_world(QUICKSAVE_PATH, self.simulation)
+        except OSError as error:
+            self.notify(f"Save failed: {error}", RED)
+        else:
+            self.notify("Saved")
+    
+    def quickload(self):
+        if self.history is None:
+            self.notify("Load failed: this world cannot be loaded", RED)
+            return
+        try:
+            load_world(QUICKSAVE_PATH, self.simulation)
+        except (OSError, ValueError) as error:
+            self.notify(f"Load failed: {error}", RED)
+            return
+        self.history.clear()
+        self.history.push(self.simulation)
+        compositor.invalidate()
+        self.notify("Loaded")
+    
+    def handle_events(self, events):
+        simulation = self.simulation
+        with profiler.stage('events'):
+            for event in events:
+                if event.type == pygame.QUIT:
+                    self.running = False
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_ESCAPE:
+                        self.running = False
+                    elif event.key == pygame.K_F3:
+                        profiler.toggle_overlay()
+                        profiler_overlay.reset()
+                    elif event.key == pygame.K_F5:
+                        self.quicksave()
+                    elif event.key == pygame.K_F9 and os.path.exists(QUICKSAVE_PATH):
+                        self.quickload()
+                    elif event.key == pygame.K_SPACE and not simulation.game_over:
+                        shoot(self.player, self.enemies)
+                elif event.type == pygame.MOUSEMOTION and not simulation.game_over:
+                    mouse_dx = event.rel[0]
+                    self.player.rotate(mouse_dx=mouse_dx)
+                elif event.type == pygame.VIDEORESIZE:
+                    self.display.update(event.w, event.h)
+                    text_cache.clear()
+                    self.screen = pygame.display.set_mode((self.display.width, self.display.height),
+                                                          pygame.RESIZABLE if self.resizable else 0)
+                    compositor.invalidate()
+        
+        with profiler.stage('touch_update'):
+            self.touch_control.update(events, self.display)
+            
+            if self.touch_control.shoot_button_pressed and not simulation.game_over:
+                shoot(self.player, self.enemies)
+    
+    def advance(self, elapsed, keys):
+        """Run the ticks `elapsed` seconds owe; returns whether this frame rewound."""
+        simulation = self.simulation
+        self.accumulator += elapsed
+        rewinding = bool(keys[pygame.K_BACKSPACE]) and self.history is not None
+        while self.accumulator >= simulation.dt:
+            # Holding backspace plays the last REWIND_SECONDS backwards, one snapshot per tick.
+            if rewinding:
+                with profiler.stage('history'):
+                    self.history.pop(simulation)
+            elif not simulation.finished:
+                simulation.step(keys, self.touch_control)
+                if self.history is not None:
+                    with profiler.stage('history'):
+                        self.history.push(simulation)
+            self.accumulator -= simulation.dt
+        return rewinding
+    
+    def draw(self, rewinding=False):
+        simulation = self.simulation
+        display = self.display
+        screen = self.screen
+        # A finished or rewinding simulation has no next tick to blend towards.
+        alpha = 1.0 if simulation.finished or rewinding else self.accumulator / simulation.dt
+        view_player, view_enemies = simulation.interpolated(alpha)
+        
+        with profiler.stage('render_3d'):
+            if compositor.needs_scene(screen, scene_key(view_player, view_enemies, display)):
+                render_3d(screen, view_player, view_enemies, display)
+                compositor.capture(screen)
+        
+        with profiler.stage('draw_minimap'):
+            layers = [minimap_layer.update_layer(view_player, view_enemies, display)]
+        with profiler.stage('draw_hud'):
+            layers.extend(update_hud(view_player, view_enemies, display))
+        with profiler.stage('touch_draw'):
+            layers.extend(self.touch_control.update_layers(display))
+        
+        if simulation.game_over:
+            layers.append(update_end_screen(display, "GAME OVER", RED))
+        
+        if simulation.victory:
+            layers.append(update_end_screen(display, "VICTORY!", GREEN))
+        
+        if self.message and time.perf_counter() < self.message_until:
+            layers.append(update_message(display, self.message, self.message_color))
+        
+        if profiler.overlay:
+            layers.append(profiler_overlay.update_layer())
+        
+        with profiler.stage('present'):
+            compositor.present(screen, layers, display)
+    
+    def frame(self, events, keys, elapsed):
+        frame_start = time.perf_counter()
+        self.handle_events(events)
+        rewinding = self.advance(elapsed, keys)
+        self.draw(rewinding)
+        
+        if profiler.enabled:
+            profiler.record('frame', frame_start, time.perf_counter())
+        profiler.end_frame(sprites_drawn=render_counters.sprites_drawn,
+                           sprites_culled=render_counters.sprites_culled,
+                           text_cache_hits=text_cache.hits,
+                           text_cache_misses=text_cache.misses,
+                           sprite_cache_hits=sprite_atlas.hits,
+                           sprite_cache_misses=sprite_atlas.misses,
+                           sprite_cache_kb=sprite_atlas.bytes // 1024,
+                           pvs_culled=visibility.culled,
+                           pvs_rows_built=visibility.rows_built,
+                           flow_rebuilds=flow_field.rebuilds,
+                           minimap_renders=minimap_layer.renders,
+                           full_frames=compositor.full_frames,
+                           partial_frames=compositor.partial_frames,
+                           render_scale=round(self.display.render_scale(), 2))
+
+def main(level_path=None, trace_path=None, render_mode='numpy', workers=None):
+    init()
+    if level_path:
+        load_level(level_path)
+    if trace_path:
+        profiler.start_trace(trace_path)
+    
+    display = DisplayConfig()
+    display.render_mode = render_mode
+    if workers:
+        display.render_workers = workers
+    display.update(display.width, display.height)
+    screen = pygame.display.set_mode((display.width, display.height), pygame.RESIZABLE)
+    pygame.display.set_caption("FPS - Mobile Optimized")
+    clock = pygame.time.Clock()
+    
+    player = Player(*game_map.level.player_start)
+    enemies = EnemyPool.from_positions(game_map.level.spawns)
+    game = Game(screen, display, player, enemies, resizable=True)
+    
+    visibility.ensure(VisibilityTable.cache_path_for(level_path) if level_path else None)
+    display.resolution = AdaptiveResolution()
+    
+    pygame.mouse.set_visible(False)
+    pygame.event.set_grab(True)
+    
+    while game.running:
+        elapsed = min(clock.tick(FPS) / 1000, 0.25)
+        display.resolution.record(clock.get_rawtime())
+        game.frame(pygame.event.get(), pygame.key.get_pressed(), elapsed)
+    
+    profiler.stop_trace()
+    close_render_pools()
+    pygame.quit()
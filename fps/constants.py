@@ -0,0 +1,18 @@
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+RED = (255, 0, 0)
+GREEN = (0, 255, 0)
+BLUE = (0, 0, 255)
+GRAY = (128, 128, 128)
+DARK_GRAY = (64, 64, 64)
+YELLOW = (255, 255, 0)
+SEMI_TRANSPARENT = (100, 100, 100, 128)
+
+TILE_SIZE = 64
+MAX_DEPTH = 20
+FPS = 60
+TICK_RATE = 60
+REWIND_SECONDS = 10
+# Rewind gets shorter on levels whose snapshots would not fit in this.
+REWIND_MEMORY = 64 << 20
+QUICKSAVE_PATH = 'quicksave.fpsw'
@@ -0,0 +1,800 @@
+import copy
+import math
+import time
+
+import numpy as np
+
+from . import map as game_map
+from .input import K_a, K_d, K_s, K_w
+from .profiler import profiler
+from .raycaster import has_line_of_sight, visibility
+
+class Player:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+        self.angle = 0
+        self.health = 100
+        self.ammo = 100
+        self.speed = 0.05
+        self.rotation_speed = 0.03
+        self.prev_x = x
+        self.prev_y = y
+    
+    def begin_tick(self):
+        self.prev_x = self.x
+        self.prev_y = self.y
+    
+    def lerp(self, alpha):
+        view = copy.copy(self)
+        view.x = self.prev_x + (self.x - self.prev_x) * alpha
+        view.y = self.prev_y + (self.y - self.prev_y) * alpha
+        return view
+        
+    def move(self, keys, enemies, touch_control=None, time_scale=1.0):
+        new_x, new_y = self.x, self.y
+        
+        move_vector = [0.0, 0.0]
+        
+        if keys[K_w]:
+            move_vector[0] += math.cos(self.angle)
+            move_vector[1] += math.sin(self.angle)
+        if keys[K_s]:
+            move_vector[0] -= math.cos(self.angle)
+            move_vector[1] -= math.sin(self.angle)
+        if keys[K_a]:
+            move_vector[0] += math.cos(self.angle - math.pi/2)
+            move_vector[1] += math.sin(self.angle - math.pi/2)
+        if keys[K_d]:
+            move_vector[0] += math.cos(self.angle + math.pi/2)
+            move_vector[1] += math.sin(self.angle + math.pi/2)
+        
+        if touch_control and touch_control.left_stick_active:
+            dx, dy = touch_control.left_stick_delta
+            length = math.sqrt(dx**2 + dy**2)
+            if length > 0:
+                norm_dx = dx / length
+                norm_dy = dy / length
+                move_vector[0] += norm_dx
+                move_vector[1] += norm_dy
+        
+        if move_vector[0] != 0 or move_vector[1] != 0:
+            new_x += move_vector[0] * self.speed * time_scale
+            new_y += move_vector[1] * self.speed * time_scale
+            
+        map_x = int(new_x)
+        map_y = int(new_y)
+        
+        if game_map.level.inside(map_x, map_y):
+            if game_map.level.tile(map_x, map_y) == 0:
+                if not enemy_within(enemies, new_x, new_y, 0.3):
+                    self.x = new_x
+                    self.y = new_y
+    
+    def rotate(self, mouse_dx=0, touch_control=None, time_scale=1.0):
+        if mouse_dx != 0:
+            self.angle += mouse_dx * self.rotation_speed
+        
+        if touch_control and touch_control.right_stick_active:
+            dx = touch_control.right_stick_delta[0]
+            self.angle += dx * 0.001 * time_scale
+        
+        self.angle %= 2 * math.pi
+
+class FlowField:
+    OFFSETS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+    
+    def __init__(self, radius=64):
+        # The field only covers tiles within `radius` of the player; enemies
+        # further out head straight for the player until they get close.
+        self.radius = radius
+        self.key = None
+        self.target = None
+        self.origin = (0, 0)
+        self.distance = None
+        self.step_x = None
+        self.step_y = None
+        self.rebuilds = 0
+    
+    def update(self, player):
+        target = (int(player.x), int(player.y))
+        key = (game_map.level.version, target)
+        if key != self.key:
+            self.build(target)
+            self.key = key
+    
+    def build(self, target):
+        self.target = target
+        origin_x = min(max(target[0] - self.radius, 0), game_map.level.width)
+        origin_y = min(max(target[1] - self.radius, 0), game_map.level.height)
+        tiles = game_map.level.window(origin_x, origin_y, target[0] + self.radius + 1, target[1] + self.radius + 1)
+        self.origin = (origin_x, origin_y)
+        height, width = tiles.shape
+        padded_width = width + 2
+        walkable = np.zeros((height + 2, padded_width), dtype=bool)
+        walkable[1:-1, 1:-1] = tiles == 0
+        walkable = walkable.ravel()
+        
+        distance = np.full(walkable.shape, -1, dtype=np.int32)
+        target_x = target[0] - origin_x
+        target_y = target[1] - origin_y
+        if 0 <= target_x < width and 0 <= target_y < height:
+            start = (target_y + 1) * padded_width + target_x + 1
+            if walkable[start]:
+                distance[start] = 0
+                frontier = np.array([start])
+                ring = 0
+                while frontier.size:
+                    ring += 1
+                    neighbours = np.concatenate([frontier + 1, frontier - 1,
+                                                 frontier + padded_width, frontier - padded_width])
+                    neighbours = np.unique(neighbours[walkable[neighbours] & (distance[neighbours] < 0)])
+                    distance[neighbours] = ring
+                    frontier = neighbours
+        
+        grid = distance.reshape(height + 2, padded_width)
+        reachable = np.where(grid >= 0, grid, np.iinfo(np.int32).max)
+        best = reachable[1:-1, 1:-1].copy()
+        step_x = np.zeros((height, width), dtype=np.int8)
+        step_y = np.zeros((height, width), dtype=np.int8)
+        open_grid = walkable.reshape(height + 2, padded_width)
+        for offset_x, offset_y in self.OFFSETS:
+            neighbour = reachable[1 + offset_y:height + 1 + offset_y, 1 + offset_x:width + 1 + offset_x]
+            better = neighbour < best
+            if offset_x and offset_y:
+                better &= open_grid[1:-1, 1 + offset_x:width + 1 + offset_x]
+                better &= open_grid[1 + offset_y:height + 1 + offset_y, 1:-1]
+            best = np.where(better, neighbour, best)
+            step_x[better] = offset_x
+            step_y[better] = offset_y
+        
+        blocked = grid[1:-1, 1:-1] < 0
+        step_x[blocked] = 0
+        step_y[blocked] = 0
+        self.distance = grid[1:-1, 1:-1].copy()
+        self.step_x = step_x
+        self.step_y = step_y
+        self.rebuilds += 1
+    
+    def waypoint(self, x, y, player):
+        self.update(player)
+        tile_x = int(x)
+        tile_y = int(y)
+        local_x = tile_x - self.origin[0]
+        local_y = tile_y - self.origin[1]
+        height, width = self.step_x.shape
+        if not (0 <= local_x < width and 0 <= local_y < height):
+            return player.x, player.y
+        step_x = int(self.step_x[local_y, local_x])
+        step_y = int(self.step_y[local_y, local_x])
+        next_x = tile_x + step_x
+        next_y = tile_y + step_y
+        if (step_x == 0 and step_y == 0) or (next_x, next_y) == self.target:
+            return player.x, player.y
+        return next_x + 0.5, next_y + 0.5
+    
+    def waypoints(self, x, y, player):
+        self.update(player)
+        return self.lookup(x, y, player.x, player.y)
+    
+    def lookup(self, x, y, target_x, target_y):
+        """Vectorized waypoints against the field as last built; target_x/y may be per-entry arrays."""
+        tile_x = x.astype(np.int64)
+        tile_y = y.astype(np.int64)
+        local_x = tile_x - self.origin[0]
+        local_y = tile_y - self.origin[1]
+        height, width = self.step_x.shape
+        inside = (local_x >= 0) & (local_x < width) & (local_y >= 0) & (local_y < height)
+        local_x = np.clip(local_x, 0, max(width - 1, 0))
+        local_y = np.clip(local_y, 0, max(height - 1, 0))
+        step_x = np.where(inside, self.step_x[local_y, local_x], 0)
+        step_y = np.where(inside, self.step_y[local_y, local_x], 0)
+        next_x = tile_x + step_x
+        next_y = tile_y + step_y
+        direct = ((step_x == 0) & (step_y == 0)) | ((next_x == self.target[0]) & (next_y == self.target[1]))
+        return (np.where(direct, target_x, next_x + 0.5),
+                np.where(direct, target_y, next_y + 0.5))
+
+flow_field = FlowField()
+
+class Enemy:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+        self.health = 50
+        self.alive = True
+        self.speed = 0.02
+        self.damage = 10
+        self.attack_cooldown = 0
+        self.grid = None
+        self.cell = None
+        self.prev_x = x
+        self.prev_y = y
+    
+    def begin_tick(self):
+        self.prev_x = self.x
+        self.prev_y = self.y
+        
+    def move_towards_player(self, player, enemies, time_scale=1.0):
+        if not self.alive:
+            return
+            
+        dx = player.x - self.x
+        dy = player.y - self.y
+        dist = math.sqrt(dx**2 + dy**2)
+        
+        if dist > 0.3:
+            waypoint_x, waypoint_y = flow_field.waypoint(self.x, self.y, player)
+            dx = waypoint_x - self.x
+            dy = waypoint_y - self.y
+            step = math.sqrt(dx**2 + dy**2)
+            if step == 0:
+                dx = player.x - self.x
+                dy = player.y - self.y
+                step = dist
+            new_x = self.x + (dx / step) * self.speed * time_scale
+            new_y = self.y + (dy / step) * self.speed * time_scale
+            
+            map_x = int(new_x)
+            map_y = int(new_y)
+            
+            if game_map.level.inside(map_x, map_y):
+                if game_map.level.tile(map_x, map_y) == 0:
+                    if not enemy_within(enemies, new_x, new_y, 0.3, exclude=self):
+                        self.x = new_x
+                        self.y = new_y
+                        if self.grid is not None:
+                            self.grid.update(self)
+        else:
+            if self.attack_cooldown <= 0:
+                player.health -= self.damage
+                self.attack_cooldown = 60
+                
+        if self.attack_cooldown > 0:
+            self.attack_cooldown -= time_scale
+    
+    def take_damage(self, damage):
+        self.health -= damage
+        if self.health <= 0:
+            self.alive = False
+            if self.grid is not None:
+                self.grid.remove(self)
+
+class SpatialGrid:
+    def __init__(self, cell_size=1.0):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.count = 0
+    
+    def cell_of(self, x, y):
+        return (int(x // self.cell_size), int(y // self.cell_size))
+    
+    def insert(self, entity):
+        cell = self.cell_of(entity.x, entity.y)
+        self.cells.setdefault(cell, set()).add(entity)
+        entity.cell = cell
+        entity.grid = self
+        self.count += 1
+    
+    def remove(self, entity):
+        bucket = self.cells.get(entity.cell)
+        if bucket is not None and entity in bucket:
+            bucket.discard(entity)
+            if not bucket:
+                del self.cells[entity.cell]
+            self.count -= 1
+        entity.grid = None
+        entity.cell = None
+    
+    def update(self, entity):
+        cell = self.cell_of(entity.x, entity.y)
+        if cell == entity.cell:
+            return
+        bucket = self.cells[entity.cell]
+        bucket.discard(entity)
+        if not bucket:
+            del self.cells[entity.cell]
+        self.cells.setdefault(cell, set()).add(entity)
+        entity.cell = cell
+    
+    def candidates(self, min_x, min_y, max_x, max_y):
+        cell_min_x, cell_min_y = self.cell_of(min_x, min_y)
+        cell_max_x, cell_max_y = self.cell_of(max_x, max_y)
+        for cell_y in range(cell_min_y, cell_max_y + 1):
+            for cell_x in range(cell_min_x, cell_max_x + 1):
+                bucket = self.cells.get((cell_x, cell_y))
+                if bucket:
+                    yield from bucket
+    
+    def query_radius(self, x, y, radius, exclude=None):
+        found = []
+        for entity in self.candidates(x - radius, y - radius, x + radius, y + radius):
+            if entity is exclude or not entity.alive:
+                continue
+            if (entity.x - x)**2 + (entity.y - y)**2 < radius**2:
+                found.append(entity)
+        return found
+    
+    def any_within(self, x, y, radius, exclude=None):
+        for entity in self.candidates(x - radius, y - radius, x + radius, y + radius):
+            if entity is exclude or not entity.alive:
+                continue
+            if (entity.x - x)**2 + (entity.y - y)**2 < radius**2:
+                return True
+        return False
+    
+    def query_cone(self, x, y, angle, half_angle, max_distance):
+        points_x = [x]
+        points_y = [y]
+        for edge in (angle - half_angle, angle, angle + half_angle):
+            points_x.append(x + math.cos(edge) * max_distance)
+            points_y.append(y + math.sin(edge) * max_distance)
+        for quarter in range(4):
+            axis = quarter * math.pi / 2
+            offset = (axis - angle + math.pi) % (2 * math.pi) - math.pi
+            if abs(offset) <= half_angle:
+                points_x.append(x + math.cos(axis) * max_distance)
+                points_y.append(y + math.sin(axis) * max_distance)
+        
+        found = []
+        for entity in self.candidates(min(points_x), min(points_y), max(points_x), max(points_y)):
+            if not entity.alive:
+                continue
+            dx = entity.x - x
+            dy = entity.y - y
+            distance = math.sqrt(dx**2 + dy**2)
+            if distance >= max_distance:
+                continue
+            angle_diff = (math.atan2(dy, dx) - angle + math.pi) % (2 * math.pi) - math.pi
+            if abs(angle_diff) < half_angle:
+                found.append((distance, entity))
+        found.sort(key=lambda item: item[0])
+        return found
+
+class EnemyList(list):
+    def __init__(self, enemies=(), cell_size=1.0):
+        super().__init__()
+        self.grid = SpatialGrid(cell_size)
+        for enemy in enemies:
+            self.append(enemy)
+    
+    def append(self, enemy):
+        super().append(enemy)
+        if enemy.alive:
+            self.grid.insert(enemy)
+
+class EnemyView:
+    __slots__ = ('pool', 'index')
+    
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+    
+    def __eq__(self, other):
+        return isinstance(other, EnemyView) and other.pool is self.pool and other.index == self.index
+    
+    def __hash__(self):
+        return hash((id(self.pool), self.index))
+    
+    @property
+    def x(self):
+        return float(self.pool.x[self.index])
+    
+    @x.setter
+    def x(self, value):
+        self.pool.x[self.index] = value
+    
+    @property
+    def y(self):
+        return float(self.pool.y[self.index])
+    
+    @y.setter
+    def y(self, value):
+        self.pool.y[self.index] = value
+    
+    @property
+    def health(self):
+        return int(self.pool.health[self.index])
+    
+    @property
+    def alive(self):
+        return bool(self.pool.alive[self.index])
+    
+    @property
+    def speed(self):
+        return float(self.pool.speed[self.index])
+    
+    @property
+    def damage(self):
+        return int(self.pool.damage[self.index])
+    
+    @property
+    def attack_cooldown(self):
+        return float(self.pool.cooldown[self.index])
+    
+    def take_damage(self, damage):
+        self.pool.take_damage(self.index, damage)
+
+class EnemyPool:
+    # 29 bytes per enemy: float32 x/y/prev_x/prev_y/speed/cooldown, int16 health/damage, bool alive.
+    FIELDS = ('x', 'y', 'prev_x', 'prev_y', 'health', 'alive', 'speed', 'damage', 'cooldown')
+    
+    def __init__(self, capacity=64):
+        self.count = 0
+        self.x = np.zeros(capacity, dtype=np.float32)
+        self.y = np.zeros(capacity, dtype=np.float32)
+        self.prev_x = np.zeros(capacity, dtype=np.float32)
+        self.prev_y = np.zeros(capacity, dtype=np.float32)
+        self.health = np.zeros(capacity, dtype=np.int16)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.speed = np.zeros(capacity, dtype=np.float32)
+        self.damage = np.zeros(capacity, dtype=np.int16)
+        self.cooldown = np.zeros(capacity, dtype=np.float32)
+        # The pool answers the same spatial queries as SpatialGrid.
+        self.grid = self
+    
+    @classmethod
+    def from_positions(cls, positions):
+        positions = list(positions)
+        pool = cls(max(len(positions), 1))
+        for x, y in positions:
+            pool.spawn(x, y)
+        return pool
+    
+    def spawn(self, x, y, health=50, speed=0.02, damage=10):
+        if self.count == len(self.x):
+            self.grow(len(self.x) * 2)
+        index = self.count
+        self.x[index] = x
+        self.y[index] = y
+        self.prev_x[index] = x
+        self.prev_y[index] = y
+        self.health[index] = health
+        self.alive[index] = True
+        self.speed[index] = speed
+        self.damage[index] = damage
+        self.cooldown[index] = 0
+        self.count += 1
+        return EnemyView(self, index)
+    
+    def grow(self, capacity):
+        for name in self.FIELDS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+    
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.FIELDS)
+    
+    def begin_tick(self):
+        self.prev_x[:self.count] = self.x[:self.count]
+        self.prev_y[:self.count] = self.y[:self.count]
+    
+    def lerp(self, alpha):
+        view = copy.copy(self)
+        view.x = self.prev_x + (self.x - self.prev_x) * np.float32(alpha)
+        view.y = self.prev_y + (self.y - self.prev_y) * np.float32(alpha)
+        return view
+    
+    def __len__(self):
+        return self.count
+    
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return EnemyView(self, index)
+    
+    def __iter__(self):
+        for index in np.flatnonzero(self.alive[:self.count]):
+            yield EnemyView(self, int(index))
+    
+    def alive_indices(self):
+        return np.flatnonzero(self.alive[:self.count])
+    
+    def alive_count(self):
+        return int(np.count_nonzero(self.alive[:self.count]))
+    
+    def take_damage(self, index, damage):
+        self.health[index] -= damage
+        if self.health[index] <= 0:
+            self.alive[index] = False
+    
+    def blocked(self, index, new_x, new_y, radius):
+        width = game_map.level.width + 2
+        others = self.alive_indices()
+        cell = (self.y[others].astype(np.int64) + 1) * width + self.x[others].astype(np.int64) + 1
+        # Ties within a cell don't matter (hits are OR-ed), so the faster unstable sort will do.
+        order = np.argsort(cell)
+        sorted_cell = cell[order]
+        others = others[order]
+        others_x = self.x[others]
+        others_y = self.y[others]
+        
+        # Sorted query keys keep searchsorted cache-friendly.
+        base = (new_y.astype(np.int64) + 1) * width + new_x.astype(np.int64) + 1
+        query_order = np.argsort(base)
+        base = base[query_order]
+        query_index = index[query_order]
+        query_x = new_x[query_order]
+        query_y = new_y[query_order]
+        
+        collide = np.zeros(len(index), dtype=bool)
+        for offset in (-width - 1, -width, -width + 1, -1, 0, 1, width - 1, width, width + 1):
+            target = base + offset
+            start = np.searchsorted(sorted_cell, target, 'left')
+            counts = np.searchsorted(sorted_cell, target, 'right') - start
+            for k in range(int(counts.max(initial=0))):
+                valid = k < counts
+                other = np.minimum(start + k, len(others) - 1)
+                dist_sq = (query_x - others_x[other])**2 + (query_y - others_y[other])**2
+                collide |= valid & (others[other] != query_index) & (dist_sq < radius**2)
+        
+        result = np.empty(len(index), dtype=bool)
+        result[query_order] = collide
+        return result
+    
+    def step(self, player, time_scale=1.0, index=None, field=None):
+        """Move alive enemies (or the alive subset `index`) towards `player` along `field`.
+        
+        `time_scale` is a scalar or, with `index`, one value per entry of it.
+        """
+        scale = np.asarray(time_scale, dtype=np.float32)
+        if index is None:
+            index = self.alive_indices()
+        else:
+            alive = self.alive[index]
+            index = index[alive]
+            if scale.ndim:
+                scale = scale[alive]
+        if not index.size:
+            return
+        scale = np.broadcast_to(scale, index.shape)
+        if field is None:
+            field = flow_field
+        
+        x = self.x[index]
+        y = self.y[index]
+        dx = player.x - x
+        dy = player.y - y
+        dist = np.sqrt(dx**2 + dy**2)
+        
+        moving = dist > 0.3
+        mover = index[moving]
+        waypoint_x, waypoint_y = field.waypoints(x[moving], y[moving], player)
+        steer_x = waypoint_x - x[moving]
+        steer_y = waypoint_y - y[moving]
+        step = np.sqrt(steer_x**2 + steer_y**2)
+        arrived = step == 0
+        steer_x[arrived] = dx[moving][arrived]
+        steer_y[arrived] = dy[moving][arrived]
+        step[arrived] = dist[moving][arrived]
+        new_x = x[moving] + steer_x / step * self.speed[mover] * scale[moving]
+        new_y = y[moving] + steer_y / step * self.speed[mover] * scale[moving]
+        
+        map_x = new_x.astype(np.int64)
+        map_y = new_y.astype(np.int64)
+        ok = (new_x >= 0) & (new_y >= 0) & (map_x < game_map.level.width) & (map_y < game_map.level.height)
+        ok[ok] = game_map.level.tiles(map_x[ok], map_y[ok]) == 0
+        ok[ok] = ~self.blocked(mover[ok], new_x[ok], new_y[ok], 0.3)
+        
+        self.x[mover[ok]] = new_x[ok]
+        self.y[mover[ok]] = new_y[ok]
+        
+        attackers = index[~moving]
+        attackers = attackers[self.cooldown[attackers] <= 0]
+        if attackers.size:
+            player.health -= int(self.damage[attackers].sum())
+            self.cooldown[attackers] = 60
+        
+        cooling = self.cooldown[index] > 0
+        self.cooldown[index[cooling]] -= scale[cooling]
+    
+    def query_radius(self, x, y, radius, exclude=None):
+        index = self.alive_indices()
+        dist_sq = (self.x[index] - x)**2 + (self.y[index] - y)**2
+        found = index[dist_sq < radius**2]
+        return [EnemyView(self, int(i)) for i in found if exclude is None or i != exclude.index]
+    
+    def any_within(self, x, y, radius, exclude=None):
+        return bool(self.query_radius(x, y, radius, exclude))
+    
+    def query_cone(self, x, y, angle, half_angle, max_distance):
+        index = self.alive_indices()
+        dx = self.x[index] - x
+        dy = self.y[index] - y
+        distance = np.sqrt(dx**2 + dy**2)
+        angle_diff = (np.arctan2(dy, dx) - angle + math.pi) % (2 * math.pi) - math.pi
+        inside = (distance < max_distance) & (np.abs(angle_diff) < half_angle)
+        order = np.argsort(distance[inside], kind='stable')
+        return [(float(distance[inside][i]), EnemyView(self, int(index[inside][i]))) for i in order]
+
+def step_enemies(enemies, player, time_scale=1.0):
+    if hasattr(enemies, 'step'):
+        enemies.step(player, time_scale)
+        return
+    for enemy in enemies:
+        enemy.move_towards_player(player, enemies, time_scale)
+
+def begin_enemy_tick(enemies):
+    if hasattr(enemies, 'begin_tick'):
+        enemies.begin_tick()
+        return
+    for enemy in enemies:
+        enemy.begin_tick()
+
+def interpolate_enemies(enemies, alpha):
+    if hasattr(enemies, 'lerp'):
+        return enemies.lerp(alpha)
+    views = []
+    for enemy in enemies:
+        view = copy.copy(enemy)
+        view.x = enemy.prev_x + (enemy.x - enemy.prev_x) * alpha
+        view.y = enemy.prev_y + (enemy.y - enemy.prev_y) * alpha
+        views.append(view)
+    return views
+
+class AIScheduler:
+    """Time-sliced enemy updates, tiered by distance and visibility.
+    
+    Each tier is (name, max distance, interval). Enemies the PVS says the
+    player can see always fall in the first tier. A tier with interval N updates each enemy
+    every Nth tick, staggered by enemy index, with the time it missed folded
+    into one larger step. Once the first tier is done, the rest share what is
+    left of `budget_ms`: the most overdue go first and the others wait. However
+    full the first tier is, the rest always get enough updates for each of them
+    to come round within `max_catchup` ticks, so no enemy loses time to the cap.
+    """
+    
+    TIERS = (('near', 4.0, 1), ('mid', 16.0, 4), ('far', math.inf, 16))
+    
+    def __init__(self, tiers=TIERS, budget_ms=2.0, max_catchup=16):
+        self.tiers = tuple(tiers)
+        self.budget_ms = budget_ms
+        self.max_catchup = max_catchup
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.tick = 0
+        # Seconds per enemy update, smoothed; sizes the budget.
+        self.cost = 0.0
+        self.updated = [0] * len(self.tiers)
+        self.totals = [0] * len(self.tiers)
+        self.deferred = 0
+    
+    def step(self, enemies, player, time_scale=1.0):
+        pool = hasattr(enemies, 'alive_indices')
+        if pool:
+            index = enemies.alive_indices()
+            x, y = enemies.x[index], enemies.y[index]
+        else:
+            index = np.array([i for i, enemy in enumerate(enemies) if enemy.alive], dtype=np.int64)
+            x = np.array([enemies[i].x for i in index], dtype=np.float32)
+            y = np.array([enemies[i].y for i in index], dtype=np.float32)
+        if len(self.pending) < len(enemies):
+            self.pending = np.concatenate([self.pending, np.zeros(len(enemies) - len(self.pending), np.float32)])
+        self.pending[index] += time_scale
+        self.tick += 1
+        self.updated = [0] * len(self.tiers)
+        self.deferred = 0
+        if not index.size:
+            return
+        
+        distance_sq = (x - player.x)**2 + (y - player.y)**2
+        tier = np.full(index.size, len(self.tiers) - 1)
+        for number in range(len(self.tiers) - 2, -1, -1):
+            tier[distance_sq < self.tiers[number][1]**2] = number
+        # The PVS only answers within its radius; anything further counts as unseen here.
+        tile_x, tile_y = x.astype(np.int64), y.astype(np.int64)
+        in_range = np.maximum(np.abs(tile_x - int(player.x)), np.abs(tile_y - int(player.y))) <= visibility.radius
+        in_range[in_range] = visibility.visible_many(int(player.x), int(player.y), tile_x[in_range], tile_y[in_range])
+        tier[in_range] = 0
+        
+        selected = [index[tier == 0]]
+        self.updated[0] = selected[0].size
+        waiting = []
+        for number, (name, distance, interval) in enumerate(self.tiers[1:], 1):
+            members = index[tier == number]
+            due = ((members + self.tick) % interval == 0) | (self.pending[members] >= interval * time_scale)
+            waiting.append((members[due], number))
+        
+        candidates = np.concatenate([members for members, number in waiting] or [index[:0]])
+        allowance = candidates.size
+        if self.cost > 0:
+            # Enough to cycle the lower tiers inside max_catchup ticks, and never
+            # fewer than those already at the cap.
+            quota = max(-(-(index.size - selected[0].size) // self.max_catchup),
+                        np.count_nonzero(self.pending[candidates] >= self.max_catchup * time_scale))
+            allowance = max(int(self.budget_ms / 1000 / self.cost) - selected[0].size, quota)
+        if candidates.size > allowance:
+            keep = np.argpartition(-self.pending[candidates], allowance)[:allowance]
+            chosen = np.zeros(candidates.size, dtype=bool)
+            chosen[keep] = True
+            self.deferred = candidates.size - allowance
+        else:
+            chosen = np.ones(candidates.size, dtype=bool)
+        start = 0
+        for members, number in waiting:
+            picked = members[chosen[start:start + members.size]]
+            start += members.size
+            selected.append(picked)
+            self.updated[number] = picked.size
+        
+        update = np.concatenate(selected)
+        began = time.perf_counter()
+        steps = np.minimum(self.pending[update], self.max_catchup * time_scale)
+        if pool:
+            enemies.step(player, steps, update)
+        else:
+            for i, step in zip(update.tolist(), steps.tolist()):
+                enemies[i].move_towards_player(player, enemies, step)
+        self.pending[update] = 0
+        if update.size:
+            cost = (time.perf_counter() - began) / update.size
+            self.cost = cost if self.cost == 0 else self.cost * 0.9 + cost * 0.1
+        
+        for number, (name, distance, interval) in enumerate(self.tiers):
+            self.totals[number] += self.updated[number]
+            profiler.count('ai_' + name, self.updated[number])
+        profiler.count('ai_deferred', self.deferred)
+
+def count_alive(enemies):
+    if hasattr(enemies, 'alive_count'):
+        return enemies.alive_count()
+    return sum(1 for e in enemies if e.alive)
+
+def enemy_within(enemies, x, y, radius, exclude=None):
+    grid = getattr(enemies, 'grid', None)
+    if grid is not None:
+        return grid.any_within(x, y, radius, exclude)
+    
+    for enemy in enemies:
+        if enemy is not exclude and enemy.alive:
+            dist = math.sqrt((x - enemy.x)**2 + (y - enemy.y)**2)
+            if dist < radius:
+                return True
+    return False
+
+def shoot(player, enemies):
+    if player.ammo <= 0:
+        return False
+        
+    player.ammo -= 1
+    
+    grid = getattr(enemies, 'grid', None)
+    if grid is not None:
+        for distance, enemy in grid.query_cone(player.x, player.y, player.angle, 0.1, 10):
+            if has_line_of_sight(player, enemy):
+                enemy.take_damage(25)
+                return True
+        return False
+    
+    closest_enemy = None
+    closest_distance = float('inf')
+    
+    for enemy in enemies:
+        if not enemy.alive:
+            continue
+            
+        dx = enemy.x - player.x
+        dy = enemy.y - player.y
+        distance = math.sqrt(dx**2 + dy**2)
+        
+        angle_to_enemy = math.atan2(dy, dx)
+        angle_diff = angle_to_enemy - player.angle
+        
+        while angle_diff < -math.pi:
+            angle_diff += 2 * math.pi
+        while angle_diff > math.pi:
+            angle_diff -= 2 * math.pi
+        
+        if abs(angle_diff) < 0.1 and distance < closest_distance:
+            if has_line_of_sight(player, enemy):
+                closest_distance = distance
+                closest_enemy = enemy
+    
+    if closest_enemy and closest_distance < 10:
+        closest_enemy.take_damage(25)
+        return True
+    
+    return False
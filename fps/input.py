@@ -0,0 +1,35 @@
+# SDL keycodes, equal to pygame.K_w and friends, so KeyState and
+# pygame.key.get_pressed() index the same way without importing pygame here.
+K_w = ord('w')
+K_a = ord('a')
+K_s = ord('s')
+K_d = ord('d')
+
+class KeyState:
+    def __init__(self, pressed=()):
+        self.pressed = set(pressed)
+    
+    def __getitem__(self, key):
+        return key in self.pressed
+
+NO_KEYS = KeyState()
+
+# Input bitmask shared by scripted, batched and networked players.
+FORWARD = 1
+BACKWARD = 2
+STRAFE_LEFT = 4
+STRAFE_RIGHT = 8
+TURN_LEFT = 16
+TURN_RIGHT = 32
+FIRE = 64
+NUM_ACTIONS = 128
+TURN_SPEED = 0.05
+
+ACTION_KEYS = ((FORWARD, K_w), (BACKWARD, K_s),
+               (STRAFE_LEFT, K_a), (STRAFE_RIGHT, K_d))
+
+def action_keys(action):
+    return KeyState(key for bit, key in ACTION_KEYS if action & bit)
+
+def keys_action(keys):
+    return sum(bit for bit, key in ACTION_KEYS if keys[key])
@@ -0,0 +1,194 @@
+import itertools
+import json
+import random
+import struct
+
+import numpy as np
+
+MAP = [
+    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+    [1, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+    [1, 0, 1, 0, 1, 1, 0, 1, 0, 1],
+    [1, 0, 1, 0, 0, 0, 0, 1, 0, 1],
+    [1, 0, 0, 0, 1, 0, 0, 0, 0, 1],
+    [1, 0, 1, 0, 1, 0, 1, 1, 0, 1],
+    [1, 0, 1, 0, 0, 0, 0, 0, 0, 1],
+    [1, 0, 0, 0, 1, 0, 1, 0, 0, 1],
+    [1, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+]
+
+DEFAULT_SPAWNS = [
+    (8.5, 8.5),
+    (5.5, 3.5),
+    (3.5, 7.5),
+    (7.5, 5.5),
+    (2.5, 5.5),
+]
+
+LEVEL_MAGIC = b'FPSL'
+LEVEL_FORMAT = 1
+LEVEL_CHUNKED = 1
+# magic, format, flags, width, height, chunk, spawn count, metadata bytes,
+# player start x/y, tile data offset; padded to 64 bytes.
+LEVEL_HEADER = struct.Struct('<4sHHIIIIIffQ20x')
+level_versions = itertools.count(1)
+
+class Level:
+    """Tile grid plus spawns and metadata.
+    
+    Tiles are stored as one flat uint8 buffer, either row-major or split into
+    square chunks (chunk-major, row-major inside each chunk) so that a small
+    neighbourhood of a huge map touches only a few pages of a memory map.
+    """
+    
+    def __init__(self, cells, width, height, chunk=0, spawns=(), player_start=(1.5, 1.5),
+                 metadata=None, path=None):
+        self.cells = cells
+        self.width = width
+        self.height = height
+        self.chunk = chunk
+        self.chunks_x = -(-width // chunk) if chunk else 0
+        self.spawns = [tuple(spawn) for spawn in spawns]
+        self.player_start = tuple(player_start)
+        self.metadata = dict(metadata or {})
+        self.path = path
+        self.view = memoryview(cells)
+        self.version = next(level_versions)
+        # Original value of every tile changed since load, keyed by (x, y).
+        self.edits = {}
+        self.tile = self.chunked_tile if chunk else self.flat_tile
+    
+    @classmethod
+    def from_rows(cls, rows, spawns=(), player_start=(1.5, 1.5), metadata=None):
+        grid = np.ascontiguousarray(np.array(rows, dtype=np.uint8))
+        height, width = grid.shape
+        return cls(grid.reshape(-1), width, height, 0, spawns, player_start, metadata)
+    
+    @classmethod
+    def open(cls, path):
+        """Memory-map a level file. Tiles are paged in lazily; edits stay private (copy-on-write)."""
+        with open(path, 'rb') as f:
+            header = f.read(LEVEL_HEADER.size)
+            if len(header) < LEVEL_HEADER.size:
+                raise ValueError(f"{path}: truncated level header")
+            (magic, version, flags, width, height, chunk, spawn_count, metadata_size,
+             start_x, start_y, data_offset) = LEVEL_HEADER.unpack(header)
+            if magic != LEVEL_MAGIC:
+                raise ValueError(f"{path}: not a level file")
+            if version != LEVEL_FORMAT:
+                raise ValueError(f"{path}: unsupported level format {version}")
+            spawns = np.frombuffer(f.read(spawn_count * 8), dtype='<f4').reshape(-1, 2)
+            metadata = json.loads(f.read(metadata_size) or b'{}')
+        if not flags & LEVEL_CHUNKED:
+            chunk = 0
+        size = width * height
+        if chunk:
+            size = -(-width // chunk) * -(-height // chunk) * chunk * chunk
+        cells = np.memmap(path, dtype=np.uint8, mode='c', offset=data_offset, shape=(size,))
+        return cls(cells, width, height, chunk, spawns.tolist(), (start_x, start_y), metadata, path)
+    
+    def save(self, path, chunk=None):
+        chunk = self.chunk if chunk is None else chunk
+        grid = self.to_array()
+        if chunk:
+            chunks_y = -(-self.height // chunk)
+            chunks_x = -(-self.width // chunk)
+            padded = np.ones((chunks_y * chunk, chunks_x * chunk), dtype=np.uint8)
+            padded[:self.height, :self.width] = grid
+            grid = padded.reshape(chunks_y, chunk, chunks_x, chunk).transpose(0, 2, 1, 3)
+        spawns = np.array(self.spawns, dtype='<f4').reshape(-1, 2)
+        metadata = json.dumps(self.metadata).encode()
+        data_offset = LEVEL_HEADER.size + spawns.nbytes + len(metadata)
+        data_offset = (data_offset + 63) // 64 * 64
+        header = LEVEL_HEADER.pack(LEVEL_MAGIC, LEVEL_FORMAT, LEVEL_CHUNKED if chunk else 0,
+                                   self.width, self.height, chunk, len(spawns), len(metadata),
+                                   self.player_start[0], self.player_start[1], data_offset)
+        with open(path, 'wb') as f:
+            f.write(header)
+            f.write(spawns.tobytes())
+            f.write(metadata)
+            f.write(b'\0' * (data_offset - f.tell()))
+            f.write(np.ascontiguousarray(grid).tobytes())
+    
+    def flat_tile(self, x, y):
+        return self.view[y * self.width + x]
+    
+    def chunked_tile(self, x, y):
+        chunk = self.chunk
+        return self.view[((y // chunk) * self.chunks_x + x // chunk) * chunk * chunk
+                         + (y % chunk) * chunk + x % chunk]
+    
+    def index(self, xs, ys):
+        if not self.chunk:
+            return ys * self.width + xs
+        chunk = self.chunk
+        return ((ys // chunk) * self.chunks_x + xs // chunk) * chunk * chunk + (ys % chunk) * chunk + xs % chunk
+    
+    def tiles(self, xs, ys):
+        return self.cells[self.index(np.asarray(xs, dtype=np.int64), np.asarray(ys, dtype=np.int64))]
+    
+    def inside(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+    
+    def window(self, x0, y0, x1, y1):
+        """Tiles in [x0, x1) x [y0, y1), clamped to the map."""
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.width), min(y1, self.height)
+        if not self.chunk:
+            return np.array(self.cells.reshape(self.height, self.width)[y0:y1, x0:x1])
+        ys, xs = np.mgrid[y0:y1, x0:x1]
+        return self.tiles(xs, ys)
+    
+    def to_array(self):
+        return self.window(0, 0, self.width, self.height)
+    
+    def set_tile(self, x, y, value):
+        index = self.index(x, y)
+        self.edits.setdefault((x, y), int(self.cells[index]))
+        self.cells[index] = value
+        self.version = next(level_versions)
+
+level = Level.from_rows(MAP, DEFAULT_SPAWNS)
+
+def set_map(grid, spawns=(), player_start=(1.5, 1.5)):
+    global level
+    level = Level.from_rows(grid, spawns, player_start)
+    return level
+
+def load_level(path):
+    global level
+    level = Level.open(path)
+    return level
+
+def set_tile(x, y, value):
+    # The PVS lives with the raycaster, which imports this module.
+    from .raycaster import visibility
+    previous = level.version
+    level.set_tile(x, y, value)
+    visibility.update_cell(x, y, previous)
+
+def make_map(size, seed=0, pillar_chance=0.5):
+    """A bordered `size` x `size` arena with random pillars on every other tile (the default map at size 10)."""
+    if size == len(MAP) and size == len(MAP[0]):
+        return [list(row) for row in MAP]
+
+    rng = random.Random(seed)
+    grid = [[0] * size for _ in range(size)]
+    for i in range(size):
+        grid[0][i] = grid[size - 1][i] = 1
+        grid[i][0] = grid[i][size - 1] = 1
+    for y in range(2, size - 2, 2):
+        for x in range(2, size - 2, 2):
+            if rng.random() < pillar_chance:
+                grid[y][x] = 1
+    grid[1][1] = 0
+    return grid
+
+def spawn_layout(grid, count, seed=0):
+    rng = random.Random(seed)
+    free_y, free_x = np.nonzero(np.asarray(grid) == 0)
+    free = [(int(x), int(y)) for x, y in zip(free_x, free_y) if (x, y) != (1, 1)]
+    # One enemy per tile, so no two start on top of each other; a map too small
+    # for `count` gets one on every free tile instead.
+    return [(x + 0.5, y + 0.5) for x, y in rng.sample(free, min(count, len(free)))]
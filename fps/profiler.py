@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+class ProfileStage:
+    __slots__ = ('profiler', 'name', 'start')
+    
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+
+class NullStage:
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        pass
+
+NULL_STAGE = NullStage()
+
+class Profiler:
+    """Per-stage frame timings and counters.
+    
+    While disabled, stage() hands back a shared no-op context manager and
+    count() returns at once, so instrumented code pays one attribute check.
+    Enabling the overlay, a trace or collect() turns recording on;
+    ui.ProfilerOverlay draws the overlay.
+    """
+    
+    def __init__(self, window=120, refresh=0.25):
+        self.window = window
+        self.refresh = refresh
+        self.enabled = False
+        self.overlay = False
+        self.collecting = False
+        self.stages = {}
+        self.timings = {}
+        self.counters = {}
+        self.frame_counters = {}
+        self.frames = 0
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.trace = None
+    
+    def stage(self, name):
+        if not self.enabled:
+            return NULL_STAGE
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = ProfileStage(self, name)
+            self.stages[name] = stage
+        return stage
+    
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+    
+    def record(self, name, start, end):
+        samples = self.timings.get(name)
+        if samples is None:
+            samples = deque(maxlen=self.window)
+            self.timings[name] = samples
+        samples.append((end - start) * 1000)
+        if self.trace:
+            self.write_event({'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                              'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6})
+    
+    def end_frame(self, **gauges):
+        """Close the frame's counters; `gauges` are reported as-is (cumulative cache stats and the like)."""
+        if not self.enabled:
+            return
+        with self.lock:
+            counters, self.counters = self.counters, {}
+        counters.update(gauges)
+        self.frame_counters = counters
+        self.frames += 1
+        if self.trace and counters:
+            self.write_event({'name': 'counters', 'ph': 'C', 'pid': os.getpid(),
+                              'ts': (time.perf_counter() - self.origin) * 1e6, 'args': counters})
+    
+    def update_enabled(self):
+        self.enabled = self.overlay or self.collecting or self.trace is not None
+    
+    def collect(self, on=True):
+        """Record with no overlay or trace open, for tools that read `timings` themselves."""
+        self.collecting = on
+        self.update_enabled()
+    
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        self.update_enabled()
+    
+    def start_trace(self, path):
+        """Stream Chrome trace-event JSON to `path` (load it in chrome://tracing or Perfetto)."""
+        self.stop_trace()
+        self.trace = open(path, 'w')
+        self.trace.write('[\n')
+        self.update_enabled()
+    
+    def write_event(self, event):
+        self.trace.write(json.dumps(event))
+        self.trace.write(',\n')
+    
+    def stop_trace(self):
+        if self.trace is None:
+            return
+        self.trace.write(json.dumps({'name': 'process_name', 'ph': 'M', 'pid': os.getpid(),
+                                     'args': {'name': 'FPS-PYTHON'}}))
+        self.trace.write('\n]\n')
+        self.trace.close()
+        self.trace = None
+        self.update_enabled()
+    
+    def summary(self):
+        return {name: (sum(samples) / len(samples), max(samples))
+                for name, samples in self.timings.items() if samples}
+
+profiler = Profiler()
@@ -0,0 +1,436 @@
+import hashlib
+import math
+import os
+import time
+
+import numpy as np
+
+from . import map as game_map
+from .constants import MAX_DEPTH
+from .profiler import profiler
+
+SIDE_EW = 0
+SIDE_NS = 1
+
+def dda_cast(origin_x, origin_y, dir_x, dir_y, max_depth=MAX_DEPTH):
+    map_x = int(origin_x)
+    map_y = int(origin_y)
+    
+    delta_x = abs(1 / dir_x) if dir_x != 0 else float('inf')
+    delta_y = abs(1 / dir_y) if dir_y != 0 else float('inf')
+    
+    if dir_x < 0:
+        step_x = -1
+        side_dist_x = (origin_x - map_x) * delta_x
+    else:
+        step_x = 1
+        side_dist_x = (map_x + 1 - origin_x) * delta_x
+    
+    if dir_y < 0:
+        step_y = -1
+        side_dist_y = (origin_y - map_y) * delta_y
+    else:
+        step_y = 1
+        side_dist_y = (map_y + 1 - origin_y) * delta_y
+    
+    steps = 0
+    while True:
+        steps += 1
+        if side_dist_x < side_dist_y:
+            dist = side_dist_x
+            side_dist_x += delta_x
+            map_x += step_x
+            side = SIDE_EW
+        else:
+            dist = side_dist_y
+            side_dist_y += delta_y
+            map_y += step_y
+            side = SIDE_NS
+        
+        if dist >= max_depth:
+            result = max_depth, None, side, 0.0
+            break
+        
+        if map_x < 0 or map_x >= game_map.level.width or map_y < 0 or map_y >= game_map.level.height:
+            result = max_depth, None, side, 0.0
+            break
+        
+        if game_map.level.tile(map_x, map_y) == 1:
+            if side == SIDE_EW:
+                tex_u = origin_y + dist * dir_y
+                tex_u -= math.floor(tex_u)
+                if dir_x > 0:
+                    tex_u = 1 - tex_u
+            else:
+                tex_u = origin_x + dist * dir_x
+                tex_u -= math.floor(tex_u)
+                if dir_y < 0:
+                    tex_u = 1 - tex_u
+            result = dist, (map_x, map_y), side, tex_u
+            break
+    
+    if profiler.enabled:
+        profiler.count('rays')
+        profiler.count('dda_steps', steps)
+    return result
+
+def cast_ray(player, angle, display=None):
+    return dda_cast(player.x, player.y, math.cos(angle), math.sin(angle))
+
+def trace_rays(origin_x, origin_y, dir_x, dir_y, max_depth=MAX_DEPTH):
+    n = len(dir_x)
+    origin_x = np.broadcast_to(np.asarray(origin_x, dtype=np.float64), (n,))
+    origin_y = np.broadcast_to(np.asarray(origin_y, dtype=np.float64), (n,))
+    max_depth = np.broadcast_to(np.asarray(max_depth, dtype=np.float64), (n,))
+    
+    start_x = origin_x.astype(np.int64)
+    start_y = origin_y.astype(np.int64)
+    map_x = start_x.copy()
+    map_y = start_y.copy()
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta_x = np.abs(1 / dir_x)
+        delta_y = np.abs(1 / dir_y)
+        step_x = np.where(dir_x < 0, -1, 1)
+        step_y = np.where(dir_y < 0, -1, 1)
+        side_dist_x = np.where(dir_x < 0, (origin_x - start_x) * delta_x, (start_x + 1 - origin_x) * delta_x)
+        side_dist_y = np.where(dir_y < 0, (origin_y - start_y) * delta_y, (start_y + 1 - origin_y) * delta_y)
+    
+    depth = max_depth.copy()
+    wall_x = np.full(n, -1, dtype=np.int64)
+    wall_y = np.full(n, -1, dtype=np.int64)
+    side = np.zeros(n, dtype=np.int64)
+    tex_u = np.zeros(n)
+    
+    active = np.arange(n)
+    steps = 0
+    while active.size:
+        steps += active.size
+        sdx = side_dist_x[active]
+        sdy = side_dist_y[active]
+        use_x = sdx < sdy
+        dist = np.where(use_x, sdx, sdy)
+        
+        side_dist_x[active] = np.where(use_x, sdx + delta_x[active], sdx)
+        side_dist_y[active] = np.where(use_x, sdy, sdy + delta_y[active])
+        mx = map_x[active] + np.where(use_x, step_x[active], 0)
+        my = map_y[active] + np.where(use_x, 0, step_y[active])
+        map_x[active] = mx
+        map_y[active] = my
+        side[active] = np.where(use_x, SIDE_EW, SIDE_NS)
+        
+        finished = (dist >= max_depth[active]) | (mx < 0) | (mx >= game_map.level.width) | (my < 0) | (my >= game_map.level.height)
+        hit = ~finished
+        hit[hit] = game_map.level.tiles(mx[hit], my[hit]) == 1
+        
+        if hit.any():
+            rays = active[hit]
+            hit_dist = dist[hit]
+            hit_ew = use_x[hit]
+            u = np.where(hit_ew, origin_y[rays] + hit_dist * dir_y[rays], origin_x[rays] + hit_dist * dir_x[rays])
+            u -= np.floor(u)
+            flip = np.where(hit_ew, dir_x[rays] > 0, dir_y[rays] < 0)
+            depth[rays] = hit_dist
+            wall_x[rays] = mx[hit]
+            wall_y[rays] = my[hit]
+            tex_u[rays] = np.where(flip, 1 - u, u)
+        
+        active = active[~(finished | hit)]
+    
+    if profiler.enabled:
+        profiler.count('rays', n)
+        profiler.count('dda_steps', steps)
+    return depth, wall_x, wall_y, side, tex_u
+
+def cast_rays(origin_x, origin_y, angles, max_depth=MAX_DEPTH):
+    return trace_rays(origin_x, origin_y, np.cos(angles), np.sin(angles), max_depth)
+
+def segments_clear(x0, y0, x1, y1):
+    dx = x1 - x0
+    dy = y1 - y0
+    length = np.sqrt(dx**2 + dy**2)
+    safe = np.where(length > 0, length, 1)
+    wall_x = trace_rays(x0, y0, dx / safe, dy / safe, length)[1]
+    return wall_x < 0
+
+class VisibilityTable:
+    SAMPLES = ((0.5, 0.5), (0.01, 0.01), (0.99, 0.01), (0.01, 0.99), (0.99, 0.99))
+    NEIGHBOURS = ((0, 0), (1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+    FORMAT = 2
+    
+    def __init__(self, radius=10, band_tiles=1 << 15, max_tiles=1 << 20):
+        self.radius = radius
+        # Source tiles traced per pass; each holds a few window-sized boolean planes while it runs.
+        self.band_tiles = band_tiles
+        # Larger maps skip the table and every query falls through to an exact ray cast.
+        self.max_tiles = max_tiles
+        self.window = 2 * radius + 1
+        self.sight_lines = None
+        self.version = None
+        self.map_hash = None
+        self.tile_index = None
+        self.bits = None
+        self.builds = 0
+        self.build_ms = 0.0
+        self.rows_built = 0
+        self.exact_checks = 0
+        self.culled = 0
+    
+    def map_digest(self):
+        digest = hashlib.sha1()
+        digest.update(np.array([self.FORMAT, self.radius, game_map.level.width, game_map.level.height], dtype=np.int64).tobytes())
+        digest.update(game_map.level.to_array().tobytes())
+        return digest.hexdigest()
+    
+    @staticmethod
+    def cache_path_for(map_path):
+        return map_path + '.pvs.npz'
+    
+    def ensure(self, cache_path=None):
+        """Bring the table up to date with the level; `build_ms` is what this load cost."""
+        if self.version == game_map.level.version:
+            return
+        start = time.perf_counter()
+        with profiler.stage('pvs_build'):
+            self.prepare_level(cache_path)
+        self.build_ms = (time.perf_counter() - start) * 1000
+    
+    def prepare_level(self, cache_path):
+        if game_map.level.width * game_map.level.height > self.max_tiles:
+            self.tile_index = self.bits = None
+            self.version = game_map.level.version
+            return
+        map_hash = self.map_digest()
+        if cache_path and self.load(cache_path, map_hash):
+            self.version = game_map.level.version
+            return
+        self.build()
+        if cache_path:
+            self.save(cache_path)
+    
+    def load(self, path, map_hash):
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as data:
+            if str(data['map_hash']) != map_hash:
+                return False
+            self.tile_index = data['tile_index']
+            self.bits = data['bits']
+        self.map_hash = map_hash
+        return True
+    
+    def save(self, path):
+        np.savez_compressed(path, map_hash=np.array(self.map_hash), tile_index=self.tile_index, bits=self.bits)
+    
+    def build(self):
+        """Every row, a band of source rows at a time."""
+        grid = game_map.level.to_array()
+        walkable_y, walkable_x = np.nonzero(grid == 0)
+        self.tile_index = np.full(grid.shape, -1, dtype=np.int32)
+        self.tile_index[walkable_y, walkable_x] = np.arange(len(walkable_x), dtype=np.int32)
+        self.bits = np.zeros((len(walkable_x), (self.window * self.window + 7) // 8), dtype=np.uint8)
+        band = max(1, self.band_tiles // max(game_map.level.width, 1))
+        for y in range(0, game_map.level.height, band):
+            self.trace(0, y, game_map.level.width, y + band)
+        
+        self.map_hash = self.map_digest()
+        self.version = game_map.level.version
+        self.builds += 1
+    
+    @staticmethod
+    def sight_cells(source_x, source_y, target_x, target_y):
+        """Cells a segment between two points inside tile (0, 0) and a tile at an
+        integer offset passes through, as offsets from the source tile.
+        
+        The walk follows trace_rays, except that a segment through a corner
+        slips between the two tiles touching it, as far as floating point can tell.
+        """
+        dx = target_x - source_x
+        dy = target_y - source_y
+        length = math.hypot(dx, dy)
+        delta_x = abs(length / dx) if dx else math.inf
+        delta_y = abs(length / dy) if dy else math.inf
+        step_x = -1 if dx < 0 else 1
+        step_y = -1 if dy < 0 else 1
+        side_x = (source_x if dx < 0 else 1 - source_x) * delta_x
+        side_y = (source_y if dy < 0 else 1 - source_y) * delta_y
+        map_x = map_y = 0
+        cells = []
+        while True:
+            dist = min(side_x, side_y)
+            if dist >= length:
+                return frozenset(cells)
+            if abs(side_x - side_y) < 1e-9:
+                side_x += delta_x
+                side_y += delta_y
+                map_x += step_x
+                map_y += step_y
+            elif side_x < side_y:
+                side_x += delta_x
+                map_x += step_x
+            else:
+                side_y += delta_y
+                map_y += step_y
+            cells.append((map_x, map_y))
+    
+    def build_sight_lines(self):
+        """A trie of the cells each window offset needs clear, shared between offsets.
+        
+        An offset is visible when every cell of any one of its sample segments is
+        walkable. Segments whose cells include another's are dropped, and cells are
+        keyed nearest first, so most of the work is shared between neighbouring offsets.
+        """
+        root = {}
+        for offset_y in range(-self.radius, self.radius + 1):
+            for offset_x in range(-self.radius, self.radius + 1):
+                if offset_x == 0 and offset_y == 0:
+                    continue
+                ends = {(0, 0), (offset_x, offset_y)}
+                lines = {self.sight_cells(source_x, source_y, offset_x + target_x, offset_y + target_y) - ends
+                         for source_x, source_y in self.SAMPLES for target_x, target_y in self.SAMPLES}
+                bit = (offset_y + self.radius) * self.window + offset_x + self.radius
+                for line in lines:
+                    if any(other < line for other in lines):
+                        continue
+                    node = root
+                    for cell in sorted(line, key=lambda cell: (cell[0]**2 + cell[1]**2, cell)):
+                        node = node.setdefault(cell, {})
+                    node.setdefault(None, []).append(bit)
+        return root
+    
+    @staticmethod
+    def span(offset, length):
+        """Slices pairing index i of a target axis with i + offset of a source axis."""
+        return slice(max(-offset, 0), length - max(offset, 0)), slice(max(offset, 0), length + min(offset, 0))
+    
+    def trace(self, x0, y0, x1, y1):
+        """Bits of the walkable tiles in [x0, x1) x [y0, y1), for every offset at once.
+        
+        Shifting the walkable mask by a cell offset lines that cell up with every
+        source tile, so one array AND per trie node covers the whole rectangle.
+        Dilation needs the sources one tile around it, so those are traced too.
+        """
+        if self.sight_lines is None:
+            self.sight_lines = self.build_sight_lines()
+        radius = self.radius
+        window = self.window
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, game_map.level.width), min(y1, game_map.level.height)
+        if x1 <= x0 or y1 <= y0:
+            return
+        region_x, region_y = max(x0 - 1, 0), max(y0 - 1, 0)
+        width = min(x1 + 1, game_map.level.width) - region_x
+        height = min(y1 + 1, game_map.level.height) - region_y
+        walkable = np.zeros((height + 2 * radius, width + 2 * radius), dtype=bool)
+        pad_x, pad_y = max(radius - region_x, 0), max(radius - region_y, 0)
+        tiles = game_map.level.window(region_x - radius, region_y - radius,
+                                      region_x + width + radius, region_y + height + radius) == 0
+        walkable[pad_y:pad_y + tiles.shape[0], pad_x:pad_x + tiles.shape[1]] = tiles
+        
+        def shifted(cell):
+            return walkable[radius + cell[1]:radius + cell[1] + height, radius + cell[0]:radius + cell[0] + width]
+        
+        seen = np.zeros((window * window, height, width), dtype=bool)
+        
+        def visit(node, clear):
+            for cell, child in node.items():
+                if cell is None:
+                    for bit in child:
+                        seen[bit] |= clear
+                else:
+                    visit(child, clear & shifted(cell))
+        
+        visit(self.sight_lines, shifted((0, 0)))
+        for offset_y in range(-radius, radius + 1):
+            for offset_x in range(-radius, radius + 1):
+                seen[(offset_y + radius) * window + offset_x + radius] &= shifted((offset_x, offset_y))
+        seen[radius * window + radius] = shifted((0, 0))
+        seen = seen.reshape(window, window, height, width)
+        
+        # Point sampling misses grazing sight lines, so a pair also counts as
+        # potentially visible when any neighbour of either tile pair sees each other.
+        spread = seen.copy()
+        for target_x, target_y in self.NEIGHBOURS[1:]:
+            (into_y, from_y), (into_x, from_x) = self.span(target_y, window), self.span(target_x, window)
+            spread[into_y, into_x] |= seen[from_y, from_x]
+        grown = np.zeros_like(spread)
+        for source_x, source_y in self.NEIGHBOURS:
+            (into_y, from_y), (into_x, from_x) = self.span(-source_y, window), self.span(-source_x, window)
+            (tile_y, near_y), (tile_x, near_x) = self.span(source_y, height), self.span(source_x, width)
+            grown[into_y, into_x, tile_y, tile_x] |= spread[from_y, from_x, near_y, near_x]
+        
+        grown = grown[:, :, y0 - region_y:y1 - region_y, x0 - region_x:x1 - region_x]
+        source_y, source_x = np.nonzero(self.tile_index[y0:y1, x0:x1] >= 0)
+        rows = self.tile_index[source_y + y0, source_x + x0]
+        self.bits[rows] = np.packbits(grown.reshape(window * window, y1 - y0, x1 - x0)[:, source_y, source_x].T, axis=1)
+        self.rows_built += len(rows)
+    
+    def visible(self, ax, ay, bx, by):
+        self.ensure()
+        offset_x = bx - ax
+        offset_y = by - ay
+        if abs(offset_x) > self.radius or abs(offset_y) > self.radius:
+            return True
+        if self.tile_index is None or not (game_map.level.inside(ax, ay) and game_map.level.inside(bx, by)):
+            return True
+        index = self.tile_index[ay, ax]
+        if index < 0 or self.tile_index[by, bx] < 0:
+            return True
+        bit = (offset_y + self.radius) * self.window + offset_x + self.radius
+        return bool(self.bits[index, bit >> 3] & (128 >> (bit & 7)))
+    
+    def visible_many(self, ax, ay, bx, by):
+        """visible() from tile (ax, ay) to arrays of target tiles."""
+        self.ensure()
+        bx = np.asarray(bx, dtype=np.int64)
+        by = np.asarray(by, dtype=np.int64)
+        result = np.ones(bx.shape, dtype=bool)
+        if self.tile_index is None or not game_map.level.inside(ax, ay) or self.tile_index[ay, ax] < 0:
+            return result
+        offset_x = bx - ax
+        offset_y = by - ay
+        near = ((np.abs(offset_x) <= self.radius) & (np.abs(offset_y) <= self.radius)
+                & (bx >= 0) & (by >= 0) & (bx < game_map.level.width) & (by < game_map.level.height))
+        near[near] = self.tile_index[by[near], bx[near]] >= 0
+        bit = (offset_y[near] + self.radius) * self.window + offset_x[near] + self.radius
+        row = self.bits[self.tile_index[ay, ax]]
+        result[near] = (row[bit >> 3] & (128 >> (bit & 7))) != 0
+        return result
+    
+    def update_cell(self, x, y, previous_version):
+        if self.version is None or self.version != previous_version or self.tile_index is None:
+            if self.version == previous_version:
+                self.version = game_map.level.version
+            return
+        value = game_map.level.tile(x, y)
+        if value == 0 and self.tile_index[y, x] < 0:
+            self.tile_index[y, x] = len(self.bits)
+            self.bits = np.vstack([self.bits, np.zeros((1, self.bits.shape[1]), dtype=np.uint8)])
+        elif value != 0:
+            self.tile_index[y, x] = -1
+        
+        # A sight line stays inside the box of its two tiles, so only sources
+        # within the radius of the cell can change; dilation reaches one tile further.
+        self.trace(x - self.radius - 1, y - self.radius - 1, x + self.radius + 2, y + self.radius + 2)
+        
+        # Chained from the edits rather than rehashing the whole map each time.
+        self.map_hash = hashlib.sha1(f"{self.map_hash}:{x},{y}={value}".encode()).hexdigest()
+        self.version = game_map.level.version
+
+visibility = VisibilityTable()
+
+def has_line_of_sight(player, enemy):
+    dx = enemy.x - player.x
+    dy = enemy.y - player.y
+    distance = math.sqrt(dx**2 + dy**2)
+    
+    if distance == 0:
+        return True
+    
+    if not visibility.visible(int(player.x), int(player.y), int(enemy.x), int(enemy.y)):
+        visibility.culled += 1
+        return False
+    
+    visibility.exact_checks += 1
+    depth, wall_pos, side, tex_u = dda_cast(player.x, player.y, dx / distance, dy / distance, distance)
+    return wall_pos is None and depth >= distance
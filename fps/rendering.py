@@ -0,0 +1,716 @@
+import pygame
+import copy
+import math
+import multiprocessing
+import os
+from collections import OrderedDict, namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from . import map as game_map
+from .constants import BLACK, DARK_GRAY, FPS, GRAY, TILE_SIZE
+from .profiler import profiler
+from .raycaster import cast_ray, cast_rays
+
+class DisplayConfig:
+    def __init__(self):
+        self.width = 800
+        self.height = 600
+        self.fov = math.pi / 3
+        self.num_rays = self.width
+        self.delta_angle = self.fov / self.num_rays
+        self.is_portrait = False
+        self.render_mode = 'numpy'
+        self.textured = True
+        # pygame.display.update(rects) for partial frames; backends that
+        # repaint the whole window anyway (OpenGL, SCALED) do better with flip().
+        self.dirty_rects = True
+        self.render_workers = os.cpu_count() or 1
+        # Rays one core keeps up with; 'parallel' gives each worker this many.
+        self.max_rays = 800
+        self.resolution = None
+        
+    def update(self, width, height):
+        self.width = width
+        self.height = height
+        self.is_portrait = height > width
+        self.num_rays = min(width, self.ray_cap())
+        self.delta_angle = self.fov / self.num_rays
+    
+    def ray_cap(self):
+        if self.render_mode == 'parallel':
+            return self.max_rays * self.render_workers
+        return self.max_rays
+    
+    def render_scale(self):
+        return self.resolution.scale if self.resolution else 1.0
+    
+    def scaled(self, scale):
+        view = copy.copy(self)
+        view.width = max(1, int(self.width * scale))
+        view.height = max(1, int(self.height * scale))
+        view.num_rays = max(1, min(view.width, int(self.num_rays * scale)))
+        view.delta_angle = view.fov / view.num_rays
+        view.resolution = None
+        return view
+
+class AdaptiveResolution:
+    def __init__(self, target_ms=1000 / FPS, min_scale=0.4, max_scale=1.0, step=0.1,
+                 sample_frames=30, headroom=0.7):
+        self.target_ms = target_ms
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.step = step
+        self.sample_frames = sample_frames
+        self.headroom = headroom
+        self.scale = max_scale
+        self.samples = []
+        self.changes = 0
+        self.surface = None
+    
+    def record(self, frame_ms):
+        self.samples.append(frame_ms)
+        if len(self.samples) < self.sample_frames:
+            return
+        
+        average = sum(self.samples) / len(self.samples)
+        self.samples = []
+        # Scale down as soon as the budget is blown, but only scale back up
+        # once there is clear headroom, so the two thresholds don't fight.
+        if average > self.target_ms and self.scale > self.min_scale:
+            self.scale = round(max(self.min_scale, self.scale - self.step), 2)
+            self.changes += 1
+        elif average < self.target_ms * self.headroom and self.scale < self.max_scale:
+            self.scale = round(min(self.max_scale, self.scale + self.step), 2)
+            self.changes += 1
+    
+    def target_surface(self, width, height):
+        if self.surface is None or self.surface.get_size() != (width, height):
+            self.surface = pygame.Surface((width, height))
+        return self.surface
+
+def render_walls(screen, player, display):
+    screen.fill(BLACK)
+    
+    pygame.draw.rect(screen, DARK_GRAY, (0, 0, display.width, display.height // 2))
+    pygame.draw.rect(screen, GRAY, (0, display.height // 2, display.width, display.height // 2))
+    
+    ray_angle = player.angle - display.fov / 2
+    depths = []
+    
+    for ray in range(display.num_rays):
+        depth, wall_pos, side, tex_u = cast_ray(player, ray_angle, display)
+        
+        depth *= math.cos(player.angle - ray_angle)
+        
+        if depth < 0.1:
+            depth = 0.1
+        depths.append(depth)
+            
+        wall_height = min(int(TILE_SIZE * display.height / (depth * TILE_SIZE)), display.height * 2)
+        
+        brightness = max(0, min(255, 255 - int(depth * 25)))
+        color = (brightness, brightness // 2, brightness // 2)
+        
+        ray_width = max(1, display.width // display.num_rays)
+        pygame.draw.rect(screen, color, 
+                        (ray * (display.width // display.num_rays), 
+                         (display.height - wall_height) // 2, 
+                         ray_width + 1, 
+                         wall_height))
+        
+        ray_angle += display.delta_angle
+    
+    return column_depths(np.array(depths), display, screen.get_width())
+
+def column_depths(ray_depths, display, width):
+    ray_width = max(1, display.width // display.num_rays)
+    owner = np.arange(width) // ray_width
+    owner[np.arange(width) == display.num_rays * ray_width] = display.num_rays - 1
+    drawn = owner < display.num_rays
+    return np.where(drawn, ray_depths[np.minimum(owner, display.num_rays - 1)], np.inf)
+
+def ray_angles(player, display):
+    steps = np.full(display.num_rays, display.delta_angle)
+    steps[0] = player.angle - display.fov / 2
+    return np.cumsum(steps)
+
+def map_colors(surface, colors):
+    colors = np.asarray(colors, dtype=np.uint32)
+    shifts = surface.get_shifts()
+    losses = surface.get_losses()
+    mapped = np.full(colors.shape[:-1], surface.get_masks()[3], dtype=np.uint32)
+    for channel in range(3):
+        mapped |= (colors[..., channel] >> losses[channel]) << shifts[channel]
+    return mapped
+
+class WallTextures:
+    """Wall textures prepared for column sampling.
+    
+    Every texture is reduced to a mip chain, and each mip level is stored
+    pre-shaded at `shades` brightness steps as column strips (u-major, so one
+    wall column is a contiguous run of texels). All of it lives in one flat
+    array of mapped pixels, so the renderer samples it with a single fancy index.
+    """
+    
+    def __init__(self, size=64, shades=32):
+        self.size = size
+        self.shades = shades
+        self.levels = size.bit_length()
+        self.images = {}
+        self.version = 0
+        self.key = None
+        self.texels = None
+        self.background = 0
+        self.offsets = None
+        self.slots = None
+        self.builds = 0
+    
+    def load(self, tile, path):
+        image = pygame.image.load(path)
+        if image.get_size() != (self.size, self.size):
+            image = pygame.transform.smoothscale(image.convert(32), (self.size, self.size))
+        self.set_image(tile, pygame.surfarray.array3d(image))
+    
+    def set_image(self, tile, pixels):
+        self.images[tile] = np.asarray(pixels, dtype=np.uint8)
+        self.version += 1
+    
+    def default_image(self):
+        # Brick pattern in the flat wall colour: 16px courses, 32px bricks, offset every other course.
+        size = self.size
+        u, v = np.meshgrid(np.arange(size), np.arange(size), indexing='ij')
+        course = v // (size // 4)
+        mortar = (v % (size // 4) < 2) | ((u + course % 2 * (size // 4)) % (size // 2) < 2)
+        noise = np.random.default_rng(0).integers(-12, 13, (size, size))
+        shade = np.where(mortar, 150, 235 + noise).clip(0, 255)
+        return np.stack([shade, shade // 2, shade // 2], axis=2).astype(np.uint8)
+    
+    @staticmethod
+    def mipmaps(image):
+        levels = [image.astype(np.float32)]
+        while levels[-1].shape[0] > 1:
+            last = levels[-1]
+            levels.append((last[0::2, 0::2] + last[1::2, 0::2] + last[0::2, 1::2] + last[1::2, 1::2]) / 4)
+        return levels
+    
+    def prepare(self, surface, background):
+        # The frame's background column rides along at the end of the texel
+        # table, so composing a column is a single gather.
+        key = (surface.get_masks(), surface.get_shifts(), surface.get_losses(), self.version)
+        if key == self.key:
+            if not np.array_equal(self.texels[self.background:], background):
+                self.texels = np.concatenate([self.texels[:self.background], background])
+            return
+        images = [self.default_image()] + [self.images[tile] for tile in sorted(self.images)]
+        self.slots = np.zeros(256, dtype=np.int64)
+        for slot, tile in enumerate(sorted(self.images), 1):
+            self.slots[tile] = slot
+        
+        factors = np.arange(self.shades, dtype=np.float32) / (self.shades - 1)
+        strips = []
+        self.offsets = np.zeros((len(images), self.levels), dtype=np.int64)
+        offset = 0
+        for slot, image in enumerate(images):
+            for mip, texels in enumerate(self.mipmaps(image)):
+                shaded = (texels[None] * factors[:, None, None, None]).astype(np.uint32)
+                strips.append(map_colors(surface, shaded).ravel())
+                self.offsets[slot, mip] = offset
+                offset += strips[-1].size
+        self.background = offset
+        self.texels = np.concatenate(strips + [background])
+        self.key = key
+        self.builds += 1
+
+wall_textures = WallTextures()
+
+def shade_rays(screen, player, angles, display):
+    depth = cast_rays(player.x, player.y, angles)[0]
+    
+    depth = depth * np.cos(player.angle - angles)
+    depth = np.maximum(depth, 0.1)
+    
+    wall_height = np.minimum((TILE_SIZE * display.height / (depth * TILE_SIZE)).astype(np.int64), display.height * 2)
+    brightness = np.clip(255 - (depth * 25).astype(np.int64), 0, 255)
+    colors = map_colors(screen, np.stack([brightness, brightness // 2, brightness // 2], axis=1))
+    top = (display.height - wall_height) // 2
+    bottom = top + wall_height
+    return depth, top, bottom, colors
+
+def shade_textured_rays(screen, player, angles, display):
+    depth, wall_x, wall_y, side, tex_u = cast_rays(player.x, player.y, angles)
+    
+    depth = depth * np.cos(player.angle - angles)
+    depth = np.maximum(depth, 0.1)
+    
+    wall_height = np.minimum((TILE_SIZE * display.height / (depth * TILE_SIZE)).astype(np.int64), display.height * 2)
+    brightness = np.clip(255 - (depth * 25).astype(np.int64), 0, 255)
+    top = (display.height - wall_height) // 2
+    bottom = top + wall_height
+    
+    textures = wall_textures
+    hit = wall_x >= 0
+    tile = np.zeros(len(angles), dtype=np.int64)
+    tile[hit] = game_map.level.tiles(wall_x[hit], wall_y[hit])
+    # Pick the mip whose texel rows roughly match the wall's screen height.
+    ratio = textures.size / np.maximum(wall_height, 1)
+    mip = np.clip(np.floor(np.log2(np.maximum(ratio, 1))).astype(np.int64), 0, textures.levels - 1)
+    size = textures.size >> mip
+    shade = brightness * (textures.shades - 1) // 255
+    u = np.minimum((tex_u * size).astype(np.int64), size - 1)
+    strip = textures.offsets[textures.slots[tile], mip] + (shade * size + u) * size
+    return depth, top, bottom, strip, size
+
+def wall_background(screen, display):
+    background = np.full(screen.get_height(), map_colors(screen, BLACK), dtype=np.uint32)
+    background[:display.height // 2] = map_colors(screen, DARK_GRAY)
+    background[display.height // 2:(display.height // 2) * 2] = map_colors(screen, GRAY)
+    return background
+
+def compose_columns(pixels, first, last, top, bottom, colors, background, display):
+    frame = np.broadcast_to(background, (last - first, len(background)))
+    
+    # Column rects are ray_width + 1 wide, so each ray also paints the first
+    # column of the next one wherever the next ray's span is shorter.
+    ray_width = max(1, display.width // display.num_rays)
+    columns = np.arange(first, last)
+    rows = np.arange(len(background))
+    for owner, valid in ((columns // ray_width - 1, (columns % ray_width == 0) & (columns > 0)),
+                         (columns // ray_width, np.ones(len(columns), dtype=bool))):
+        valid &= owner < display.num_rays
+        owner = np.clip(owner, 0, display.num_rays - 1)
+        span = (rows >= top[owner][:, None]) & (rows < bottom[owner][:, None]) & valid[:, None]
+        frame = np.where(span, colors[owner][:, None], frame)
+    
+    pixels[first:last] = frame
+
+def compose_textured_columns(pixels, first, last, top, bottom, strip, size, background, display):
+    ray_width = max(1, display.width // display.num_rays)
+    columns = np.arange(first, last)
+    owner = columns // ray_width
+    owner[columns == display.num_rays * ray_width] = display.num_rays - 1
+    valid = owner < display.num_rays
+    owner = np.minimum(owner, display.num_rays - 1)
+    
+    # v advances in 16.16 fixed point down each column. Products outside the
+    # wall span may wrap in int32, but those entries are replaced below.
+    height = np.where(valid, (bottom - top)[owner], 0).astype(np.int32)
+    step = ((size[owner] << 16) // np.maximum(height, 1)).astype(np.int32)
+    rows = np.arange(len(background), dtype=np.int32)
+    offset = rows - top[owner].astype(np.int32)[:, None]
+    span = offset.view(np.uint32) < height.view(np.uint32)[:, None]
+    index = (offset * step[:, None]) >> 16
+    index += strip[owner].astype(np.int32)[:, None]
+    np.copyto(index, wall_textures.background + rows, where=~span)
+    pixels[first:last] = wall_textures.texels[index]
+
+# What a worker needs of the player to cast its rays.
+ViewPoint = namedtuple('ViewPoint', 'x y angle')
+
+class PixelFormat:
+    """A surface's channel layout, for map_colors in a process that has no surface."""
+    
+    def __init__(self, surface):
+        self.masks = surface.get_masks()
+        self.shifts = surface.get_shifts()
+        self.losses = surface.get_losses()
+    
+    def get_masks(self):
+        return self.masks
+    
+    def get_shifts(self):
+        return self.shifts
+    
+    def get_losses(self):
+        return self.losses
+
+def render_strip(buffer, size, pixel_format, eye, display, rays, columns, background):
+    """Cast rays [first, last) and draw their columns into a shared (width, height) frame."""
+    pixels = np.ndarray(size, dtype=np.uint32, buffer=buffer)
+    # The strip's first column may also be painted by the ray before it.
+    first = max(rays[0] - 1, 0)
+    angles = ray_angles(eye, display)[first:rays[1]]
+    if display.textured:
+        shade, compose = shade_textured_rays, compose_textured_columns
+    else:
+        shade, compose = shade_rays, compose_columns
+    depth, *values = shade(pixel_format, eye, angles, display)
+    full = []
+    for value in values:
+        full.append(np.zeros(display.num_rays, dtype=value.dtype))
+        full[-1][first:rays[1]] = value
+    compose(pixels, columns[0], columns[1], *full, background, display)
+    return depth[rays[0] - first:]
+
+def render_worker(connection):
+    blocks = {}
+    
+    def attach(name):
+        if name not in blocks:
+            blocks[name] = shared_memory.SharedMemory(name=name)
+        return blocks[name].buf
+    
+    while True:
+        command, data = connection.recv()
+        if command == 'level':
+            name, width, height = data
+            cells = np.ndarray(width * height, dtype=np.uint8, buffer=attach(name))
+            game_map.level = game_map.Level(cells, width, height)
+        elif command == 'textures':
+            for name, value in data.items():
+                setattr(wall_textures, name, value)
+        elif command == 'frame':
+            connection.send(render_strip(attach(data[0]), *data[1:]))
+        else:
+            game_map.level = None
+            for block in blocks.values():
+                block.close()
+            connection.close()
+            return
+
+class RenderPool:
+    """Worker processes that each cast and draw a strip of wall columns.
+    
+    Strips are drawn straight into a frame buffer in shared memory, which the
+    main process copies to the screen. The level's tiles live in shared memory
+    too; the texel table goes over the pipes whenever it changes. Per frame a
+    worker gets only the view and its strip, and sends back its rays' depths.
+    """
+    
+    def __init__(self, workers):
+        self.workers = workers
+        context = multiprocessing.get_context('spawn')
+        self.connections = []
+        self.processes = []
+        for _ in range(workers):
+            parent, child = context.Pipe()
+            process = context.Process(target=render_worker, args=(child,), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+        self.tiles = None
+        self.frame = None
+        self.level_version = None
+        self.texels = None
+    
+    def broadcast(self, command, data):
+        for connection in self.connections:
+            connection.send((command, data))
+    
+    def share(self, block, size):
+        if block is not None and block.size >= size:
+            return block
+        if block is not None:
+            block.close()
+            block.unlink()
+        return shared_memory.SharedMemory(create=True, size=max(size, 1))
+    
+    def sync_level(self):
+        level = game_map.level
+        if self.level_version == level.version:
+            return
+        size = level.width * level.height
+        self.tiles = self.share(self.tiles, size)
+        np.ndarray(size, dtype=np.uint8, buffer=self.tiles.buf)[:] = level.to_array().ravel()
+        self.broadcast('level', (self.tiles.name, level.width, level.height))
+        self.level_version = level.version
+    
+    def sync_textures(self):
+        if self.texels is wall_textures.texels:
+            return
+        self.broadcast('textures', {name: getattr(wall_textures, name) for name in
+                                    ('size', 'shades', 'levels', 'texels', 'background', 'offsets', 'slots')})
+        self.texels = wall_textures.texels
+    
+    def render(self, screen, player, display, background):
+        width, height = screen.get_size()
+        self.frame = self.share(self.frame, width * height * 4)
+        view = copy.copy(display)
+        view.resolution = None
+        eye = ViewPoint(player.x, player.y, player.angle)
+        pixel_format = PixelFormat(screen)
+        ray_width = max(1, display.width // display.num_rays)
+        bounds = np.linspace(0, display.num_rays, min(self.workers, display.num_rays) + 1).astype(int).tolist()
+        strips = list(zip(bounds[:-1], bounds[1:]))
+        for connection, (first, last) in zip(self.connections, strips):
+            columns = (first * ray_width, width if last == display.num_rays else last * ray_width)
+            connection.send(('frame', (self.frame.name, (width, height), pixel_format, eye, view,
+                                       (first, last), columns, background)))
+        depth = np.concatenate([connection.recv() for connection in self.connections[:len(strips)]])
+        
+        pixels = pygame.surfarray.pixels2d(screen)
+        pixels[:] = np.ndarray((width, height), dtype=np.uint32, buffer=self.frame.buf)
+        del pixels
+        return depth
+    
+    def close(self):
+        self.broadcast('close', None)
+        for process in self.processes:
+            process.join()
+        for block in (self.tiles, self.frame):
+            if block is not None:
+                block.close()
+                block.unlink()
+
+render_pools = {}
+
+def get_render_pool(workers):
+    pool = render_pools.get(workers)
+    if pool is None:
+        pool = RenderPool(workers)
+        render_pools[workers] = pool
+    return pool
+
+def close_render_pools():
+    for pool in render_pools.values():
+        pool.close()
+    render_pools.clear()
+
+def render_walls_numpy(screen, player, display):
+    if screen.get_bytesize() != 4:
+        return render_walls(screen, player, display)
+    
+    angles = ray_angles(player, display)
+    background = wall_background(screen, display)
+    if display.textured:
+        wall_textures.prepare(screen, background)
+        shade, compose = shade_textured_rays, compose_textured_columns
+    else:
+        shade, compose = shade_rays, compose_columns
+    pixels = pygame.surfarray.pixels2d(screen)
+    
+    depth, *rays = shade(screen, player, angles, display)
+    compose(pixels, 0, len(pixels), *rays, background, display)
+    
+    width = len(pixels)
+    del pixels
+    return column_depths(depth, display, width)
+
+def render_walls_parallel(screen, player, display):
+    if screen.get_bytesize() != 4:
+        return render_walls(screen, player, display)
+    
+    background = wall_background(screen, display)
+    pool = get_render_pool(display.render_workers)
+    pool.sync_level()
+    if display.textured:
+        wall_textures.prepare(screen, background)
+        pool.sync_textures()
+    depth = pool.render(screen, player, display, background)
+    return column_depths(depth, display, screen.get_width())
+
+def diff_wall_renderers(player, display, workers=None):
+    display = copy.copy(display)
+    display.textured = False
+    reference = pygame.Surface((display.width, display.height))
+    vectorized = pygame.Surface((display.width, display.height))
+    render_walls(reference, player, display)
+    if workers:
+        display.render_workers = workers
+        render_walls_parallel(vectorized, player, display)
+    else:
+        render_walls_numpy(vectorized, player, display)
+    
+    reference_pixels = pygame.surfarray.array3d(reference)
+    vectorized_pixels = pygame.surfarray.array3d(vectorized)
+    return int(np.any(reference_pixels != vectorized_pixels, axis=2).sum())
+
+class RenderCounters:
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        self.sprites_drawn = 0
+        self.sprites_clipped = 0
+        self.sprites_culled = 0
+
+render_counters = RenderCounters()
+
+def render_3d(screen, player, enemies, display):
+    render_counters.reset()
+    scale = display.render_scale()
+    if scale < 1.0:
+        view = display.scaled(scale)
+        target = display.resolution.target_surface(view.width, view.height)
+    else:
+        view = display
+        target = screen
+    
+    with profiler.stage('walls'):
+        if view.render_mode == 'numpy':
+            zbuffer = render_walls_numpy(target, player, view)
+        elif view.render_mode == 'parallel':
+            zbuffer = render_walls_parallel(target, player, view)
+        else:
+            zbuffer = render_walls(target, player, view)
+    
+    with profiler.stage('sprites'):
+        render_sprites(target, player, enemies, view, zbuffer)
+    
+    if target is not screen:
+        with profiler.stage('upscale'):
+            pygame.transform.scale(target, (display.width, display.height), screen)
+
+class SpriteAtlas:
+    """Sprite art packed into one surface, plus a cache of scaled and shaded copies.
+    
+    Draw requests are rounded to a size bucket (exact up to `exact_size`,
+    then `steps_per_octave` sizes per doubling) and to one of `shades`
+    brightness steps. Each (sprite, size, shade) surface is built once and
+    shared by every enemy drawn with that sprite. The cache is LRU and evicts
+    once its pixels pass `max_bytes`.
+    """
+    
+    def __init__(self, size=128, shades=32, exact_size=32, steps_per_octave=8, max_bytes=32 << 20):
+        self.size = size
+        self.shades = shades
+        self.exact_size = exact_size
+        self.steps_per_octave = steps_per_octave
+        self.max_bytes = max_bytes
+        self.surface = None
+        self.regions = {}
+        self.opaque = {}
+        self.cache = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def load(self, name, path):
+        self.add(name, pygame.image.load(path))
+    
+    def add(self, name, image):
+        """Append `image` to the atlas as `name`, replacing any earlier art under that name."""
+        width, height = image.get_size()
+        art = pygame.Surface((width, height), pygame.SRCALPHA)
+        art.blit(image, (0, 0))
+        left = self.surface.get_width() if self.surface else 0
+        atlas = pygame.Surface((left + width, max(height, self.surface.get_height() if self.surface else 0)),
+                               pygame.SRCALPHA)
+        if self.surface:
+            atlas.blit(self.surface, (0, 0))
+        atlas.blit(art, (left, 0))
+        self.surface = atlas
+        self.regions[name] = pygame.Rect(left, 0, width, height)
+        self.opaque[name] = bool(pygame.surfarray.array_alpha(art).min() == 255)
+        for key in [key for key in self.cache if key[0] == name]:
+            self.drop(key)
+    
+    def add_defaults(self):
+        # The original look: a square body with a round head, red for enemies and blue for remote players.
+        size = self.size
+        for name, body, head in (('enemy', (255, 0, 0), (255, 128, 0)), ('player', (0, 64, 255), (255, 200, 128))):
+            image = pygame.Surface((size, size), pygame.SRCALPHA)
+            image.fill(body)
+            pygame.draw.circle(image, head, (size // 2, size // 4), size // 4)
+            self.add(name, image)
+    
+    def bucket(self, height):
+        if height <= self.exact_size:
+            return max(int(height), 1)
+        step = round(math.log2(height) * self.steps_per_octave)
+        return int(round(2 ** (step / self.steps_per_octave)))
+    
+    def get(self, name, height, brightness):
+        """The sprite `name` at about `height` pixels tall and `brightness` (0-255)."""
+        if not self.regions:
+            self.add_defaults()
+        if name not in self.regions:
+            name = 'enemy'
+        key = (name, self.bucket(height), round(brightness * (self.shades - 1) / 255))
+        surface = self.cache.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return surface
+        
+        self.misses += 1
+        surface = self.build(*key)
+        self.cache[key] = surface
+        self.bytes += surface.get_width() * surface.get_height() * 4
+        while self.bytes > self.max_bytes and len(self.cache) > 1:
+            self.drop(next(iter(self.cache)))
+            self.evictions += 1
+        return surface
+    
+    def build(self, name, height, shade):
+        region = self.regions[name]
+        width = max(round(region.width * height / region.height), 1)
+        surface = pygame.transform.smoothscale(self.surface.subsurface(region), (width, height))
+        factor = shade * 255 // (self.shades - 1)
+        surface.fill((factor, factor, factor), special_flags=pygame.BLEND_RGB_MULT)
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert() if self.opaque[name] else surface.convert_alpha()
+        return surface
+    
+    def drop(self, key):
+        surface = self.cache.pop(key)
+        self.bytes -= surface.get_width() * surface.get_height() * 4
+    
+    def clear(self):
+        self.cache.clear()
+        self.bytes = 0
+
+sprite_atlas = SpriteAtlas()
+
+def sprite_positions(enemies):
+    """Positions of the alive enemies, plus their sprite names (None means all 'enemy')."""
+    if hasattr(enemies, 'alive_indices'):
+        index = enemies.alive_indices()
+        return enemies.x[index].astype(np.float64), enemies.y[index].astype(np.float64), None
+    alive = [enemy for enemy in enemies if enemy.alive]
+    return (np.array([enemy.x for enemy in alive], dtype=np.float64),
+            np.array([enemy.y for enemy in alive], dtype=np.float64),
+            [getattr(enemy, 'sprite', 'enemy') for enemy in alive])
+
+def render_sprites(screen, player, enemies, display, zbuffer):
+    # Projection, sorting and shading are vectorized; the loop is left with
+    # the depth test and a blit of a cached sprite.
+    xs, ys, names = sprite_positions(enemies)
+    dx = xs - player.x
+    dy = ys - player.y
+    distance = np.sqrt(dx**2 + dy**2)
+    angle = (np.arctan2(dy, dx) - player.angle + math.pi) % (2 * math.pi) - math.pi
+    ahead = np.flatnonzero(np.abs(angle) < display.fov / 2 + 0.5)
+    order = ahead[np.argsort(-distance[ahead], kind='stable')]
+    
+    angle = angle[order]
+    screen_x = (display.fov / 2 + angle) / display.fov * display.width
+    depth = distance[order] * np.cos(angle)
+    distance = np.maximum(distance[order], 0.1)
+    height = np.minimum((TILE_SIZE * display.height / (distance * TILE_SIZE)).astype(np.int64), display.height)
+    left = (screen_x - height // 2).astype(np.int64)
+    brightness = np.clip(255 - (distance * 30).astype(np.int64), 0, 255)
+    
+    width = len(zbuffer)
+    first = np.maximum(left, 0)
+    last = np.minimum(left + height, width)
+    for i, screen_x, depth, height, brightness, first, last in zip(
+            order.tolist(), screen_x.tolist(), depth.tolist(), height.tolist(), brightness.tolist(),
+            first.tolist(), last.tolist()):
+        if last <= first:
+            render_counters.sprites_culled += 1
+            continue
+        
+        visible = zbuffer[first:last] > depth
+        if not visible.any():
+            render_counters.sprites_culled += 1
+            continue
+        
+        render_counters.sprites_drawn += 1
+        sprite = sprite_atlas.get(names[i] if names else 'enemy', height, brightness)
+        position = (int(screen_x) - sprite.get_width() // 2, (display.height - sprite.get_height()) // 2)
+        
+        if visible.all():
+            screen.blit(sprite, position)
+            continue
+        
+        render_counters.sprites_clipped += 1
+        clip = screen.get_clip()
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], visible.astype(np.int8), [0]))))
+        for start, end in zip(edges[::2], edges[1::2]):
+            screen.set_clip(pygame.Rect(first + start, 0, end - start, display.height).clip(clip))
+            screen.blit(sprite, position)
+        screen.set_clip(clip)
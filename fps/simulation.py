@@ -0,0 +1,272 @@
+import struct
+
+import numpy as np
+
+from . import map as game_map
+from .constants import FPS, TICK_RATE
+from .entities import (EnemyPool, Player, begin_enemy_tick, count_alive, interpolate_enemies,
+                       step_enemies)
+from .input import NO_KEYS
+from .profiler import profiler
+
+class Simulation:
+    def __init__(self, player, enemies, tick_rate=TICK_RATE, scheduler=None):
+        self.player = player
+        self.enemies = enemies
+        self.scheduler = scheduler
+        self.tick_rate = tick_rate
+        self.dt = 1 / tick_rate
+        self.time_scale = FPS / tick_rate
+        self.tick = 0
+        self.game_over = False
+        self.victory = False
+    
+    @property
+    def finished(self):
+        return self.game_over or self.victory
+    
+    def step(self, keys=NO_KEYS, touch_control=None):
+        if self.finished:
+            return
+        
+        self.player.begin_tick()
+        begin_enemy_tick(self.enemies)
+        
+        with profiler.stage('player_move'):
+            self.player.move(keys, self.enemies, touch_control, self.time_scale)
+            self.player.rotate(touch_control=touch_control, time_scale=self.time_scale)
+        with profiler.stage('enemies'):
+            if self.scheduler:
+                self.scheduler.step(self.enemies, self.player, self.time_scale)
+            else:
+                step_enemies(self.enemies, self.player, self.time_scale)
+        
+        if self.player.health <= 0:
+            self.game_over = True
+        if count_alive(self.enemies) == 0:
+            self.victory = True
+        self.tick += 1
+    
+    def simulate(self, n_ticks, controller=None):
+        for _ in range(n_ticks):
+            if self.finished:
+                break
+            keys = controller(self) if controller else NO_KEYS
+            self.step(keys if keys is not None else NO_KEYS)
+        return self.tick
+    
+    def interpolated(self, alpha):
+        return self.player.lerp(alpha), interpolate_enemies(self.enemies, alpha)
+
+def simulate(n_ticks, player=None, enemies=None, tick_rate=TICK_RATE, controller=None):
+    if player is None:
+        player = Player(*game_map.level.player_start)
+    if enemies is None:
+        enemies = EnemyPool.from_positions(game_map.level.spawns)
+    simulation = Simulation(player, enemies, tick_rate)
+    simulation.simulate(n_ticks, controller)
+    return simulation
+
+WORLD_MAGIC = b'FPSW'
+WORLD_FORMAT = 2
+WORLD_GAME_OVER = 1
+WORLD_VICTORY = 2
+# magic, format, flags, tick, map width/height, enemy count, edited tile count,
+# player x/y/prev_x/prev_y/angle, health, ammo, AI scheduler tick; 80 bytes.
+WORLD_HEADER = struct.Struct('<4sHHIIIIIdddddiiI')
+# Enemy columns follow in EnemyPool.FIELDS order, then the AI scheduler's
+# float32 pending time per enemy, then edited tiles as uint32 x, uint32 y,
+# uint8 value.
+PENDING_BYTES = 4
+ENEMY_BYTES = sum(getattr(EnemyPool(1), name).itemsize for name in EnemyPool.FIELDS) + PENDING_BYTES
+EDIT_BYTES = 9
+
+def world_size(enemy_count, edit_count):
+    """Bytes in a packed world: 80 + 33 per enemy + 9 per edited tile."""
+    return WORLD_HEADER.size + enemy_count * ENEMY_BYTES + edit_count * EDIT_BYTES
+
+def pack_world(simulation, out=None):
+    """Pack player, enemy pool, tick and scheduler state and tile edits into `out` (a uint8 array) and return the used part."""
+    pool = simulation.enemies
+    player = simulation.player
+    scheduler = simulation.scheduler
+    count = pool.count
+    edits = list(game_map.level.edits)
+    size = world_size(count, len(edits))
+    if out is None:
+        out = np.empty(size, dtype=np.uint8)
+    elif len(out) < size:
+        raise ValueError(f"world needs {size} bytes, buffer holds {len(out)}")
+
+    flags = (WORLD_GAME_OVER if simulation.game_over else 0) | (WORLD_VICTORY if simulation.victory else 0)
+    WORLD_HEADER.pack_into(out, 0, WORLD_MAGIC, WORLD_FORMAT, flags, simulation.tick,
+                           game_map.level.width, game_map.level.height, count, len(edits),
+                           player.x, player.y, player.prev_x, player.prev_y, player.angle,
+                           player.health, player.ammo, scheduler.tick if scheduler else 0)
+    offset = WORLD_HEADER.size
+    for name in EnemyPool.FIELDS:
+        column = getattr(pool, name)[:count].view(np.uint8)
+        out[offset:offset + column.size] = column
+        offset += column.size
+    pending = out[offset:offset + count * PENDING_BYTES].view(np.float32)
+    pending[:] = 0
+    if scheduler:
+        known = min(count, len(scheduler.pending))
+        pending[:known] = scheduler.pending[:known]
+    offset += pending.nbytes
+    if edits:
+        xs, ys = np.array(edits, dtype=np.uint32).T
+        for column in (xs, ys, game_map.level.tiles(xs, ys)):
+            column = np.ascontiguousarray(column).view(np.uint8)
+            out[offset:offset + column.size] = column
+            offset += column.size
+    return out[:size]
+
+def unpack_world(data, simulation):
+    """Restore `simulation` (and the current level's tiles) from a packed world.
+
+    Everything is checked before anything changes, so a bad snapshot raises
+    ValueError and leaves the simulation as it was.
+    """
+    data = np.frombuffer(data, dtype=np.uint8)
+    if len(data) < WORLD_HEADER.size:
+        raise ValueError("truncated world snapshot")
+    (magic, version, flags, tick, width, height, count, edit_count,
+     x, y, prev_x, prev_y, angle, health, ammo, scheduler_tick) = WORLD_HEADER.unpack_from(data)
+    if magic != WORLD_MAGIC:
+        raise ValueError("not a world snapshot")
+    if version != WORLD_FORMAT:
+        raise ValueError(f"unsupported world format {version}")
+    if (width, height) != (game_map.level.width, game_map.level.height):
+        raise ValueError(f"snapshot is for a {width}x{height} map, not {game_map.level.width}x{game_map.level.height}")
+    if len(data) < world_size(count, edit_count):
+        raise ValueError(f"truncated world snapshot: {count} enemies and {edit_count} edits need "
+                         f"{world_size(count, edit_count)} bytes, got {len(data)}")
+    offset = WORLD_HEADER.size + count * ENEMY_BYTES
+    xs = data[offset:offset + edit_count * 4].view(np.uint32)
+    ys = data[offset + edit_count * 4:offset + edit_count * 8].view(np.uint32)
+    if edit_count and (xs.max() >= width or ys.max() >= height):
+        raise ValueError("world snapshot edits a tile outside the map")
+
+    pool = simulation.enemies
+    if len(pool.x) < count:
+        pool.grow(count)
+    offset = WORLD_HEADER.size
+    for name in EnemyPool.FIELDS:
+        column = getattr(pool, name)
+        size = count * column.itemsize
+        column[:count] = data[offset:offset + size].view(column.dtype)
+        offset += size
+    pool.count = count
+    # The scheduler's catch-up time is part of the world: without it a replay
+    # updates enemies on different ticks, and a rewind keeps time owed by the future.
+    if simulation.scheduler:
+        simulation.scheduler.tick = scheduler_tick
+        simulation.scheduler.pending = data[offset:offset + count * PENDING_BYTES].view(np.float32).copy()
+    offset += count * PENDING_BYTES
+
+    values = data[offset + edit_count * 8:offset + edit_count * 9].tolist()
+    restore_tiles(dict(zip(zip(xs.tolist(), ys.tolist()), values)))
+
+    player = simulation.player
+    player.x, player.y, player.prev_x, player.prev_y, player.angle = x, y, prev_x, prev_y, angle
+    player.health, player.ammo = health, ammo
+    simulation.tick = tick
+    simulation.game_over = bool(flags & WORLD_GAME_OVER)
+    simulation.victory = bool(flags & WORLD_VICTORY)
+
+def restore_tiles(tiles):
+    """Set edited tiles to `tiles` ((x, y) -> value), and every other edited tile back to its original."""
+    for cell, original in list(game_map.level.edits.items()):
+        value = tiles.get(cell, original)
+        if game_map.level.tile(*cell) != value:
+            game_map.set_tile(cell[0], cell[1], value)
+    for (x, y), value in tiles.items():
+        if (x, y) not in game_map.level.edits:
+            game_map.set_tile(x, y, value)
+
+def save_world(path, simulation):
+    with open(path, 'wb') as f:
+        f.write(pack_world(simulation).tobytes())
+
+def load_world(path, simulation):
+    with open(path, 'rb') as f:
+        unpack_world(f.read(), simulation)
+
+class SnapshotRing:
+    """The last `capacity` packed worlds, for rewind and replay.
+
+    Every slot is sized for `max_enemies` and `max_edits` up front, so the
+    ring never allocates while the world fits: `nbytes` is all it will use.
+    With `max_bytes` set, fewer slots are kept when big worlds would not fit
+    `capacity` of them in it. A world that outgrows the slots reallocates
+    the ring, keeping the newest snapshots that still fit.
+    """
+
+    def __init__(self, capacity=600, max_enemies=1024, max_edits=64, max_bytes=None):
+        self.max_capacity = capacity
+        self.max_bytes = max_bytes
+        self.allocate(max_enemies, max_edits)
+
+    def allocate(self, max_enemies, max_edits):
+        self.max_enemies = max_enemies
+        self.max_edits = max_edits
+        self.slot_size = (world_size(max_enemies, max_edits) + 63) // 64 * 64
+        self.capacity = self.max_capacity
+        if self.max_bytes is not None:
+            self.capacity = max(2, min(self.capacity, self.max_bytes // self.slot_size))
+        self.slots = np.zeros((self.capacity, self.slot_size), dtype=np.uint8)
+        self.ticks = np.full(self.capacity, -1, dtype=np.int64)
+        self.head = 0
+        self.count = 0
+
+    def resize(self, max_enemies, max_edits):
+        order = [self.slot(back) for back in reversed(range(self.count))]
+        slots, ticks = self.slots, self.ticks
+        self.allocate(max_enemies, max_edits)
+        order = order[len(order) - min(len(order), self.capacity):]
+        self.slots[:len(order), :slots.shape[1]] = slots[order]
+        self.ticks[:len(order)] = ticks[order]
+        self.count = len(order)
+        self.head = self.count % self.capacity
+
+    @property
+    def nbytes(self):
+        return self.slots.nbytes + self.ticks.nbytes
+
+    def __len__(self):
+        return self.count
+
+    def push(self, simulation):
+        enemy_count = simulation.enemies.count
+        edit_count = len(game_map.level.edits)
+        if world_size(enemy_count, edit_count) > self.slot_size:
+            self.resize(max(enemy_count, self.max_enemies),
+                        max(edit_count, 2 * self.max_edits) if edit_count > self.max_edits else self.max_edits)
+        pack_world(simulation, self.slots[self.head])
+        self.ticks[self.head] = simulation.tick
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def slot(self, back=0):
+        """The snapshot `back` pushes ago (0 = newest)."""
+        if not 0 <= back < self.count:
+            raise IndexError(back)
+        return (self.head - 1 - back) % self.capacity
+
+    def restore(self, simulation, back=0):
+        unpack_world(self.slots[self.slot(back)], simulation)
+
+    def pop(self, simulation):
+        """Drop the newest snapshot and restore the one before it. False once there is nothing older."""
+        if self.count < 2:
+            return False
+        self.head = (self.head - 1) % self.capacity
+        self.count -= 1
+        self.restore(simulation)
+        return True
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+        self.ticks[:] = -1
@@ -0,0 +1,534 @@
+import pygame
+import math
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from . import map as game_map
+from .constants import BLACK, GREEN, RED, WHITE, YELLOW
+from .entities import EnemyPool, count_alive
+from .profiler import profiler
+from .rendering import sprite_positions
+
+class TextCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def font(self, size):
+        font = self.fonts.get(size)
+        if font is None:
+            # The font subsystem comes up on first use rather than at startup.
+            if not pygame.font.get_init():
+                pygame.font.init()
+            font = pygame.font.Font(None, size)
+            self.fonts[size] = font
+        return font
+    
+    def render(self, text, size, color):
+        key = (text, size, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+        
+        self.misses += 1
+        surface = self.font(size).render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surface
+    
+    def clear(self):
+        self.surfaces.clear()
+
+text_cache = TextCache()
+
+class UILayer:
+    """A retained overlay: one premultiplied-alpha surface rebuilt only when its key changes."""
+    
+    def __init__(self):
+        self.key = None
+        self.surface = None
+        self.rect = None
+        self.dirty = False
+        self.builds = 0
+    
+    def update(self, key, build):
+        if key != self.key:
+            surface, self.rect = build()
+            self.surface = surface.premul_alpha() if surface is not None else None
+            self.key = key
+            self.dirty = True
+            self.builds += 1
+        return self
+    
+    @property
+    def visible(self):
+        return self.surface is not None
+    
+    def blit(self, screen):
+        if self.surface is not None:
+            screen.blit(self.surface, self.rect, special_flags=pygame.BLEND_PREMULTIPLIED)
+
+def layer_canvas(rect):
+    # Layers are drawn with straight alpha and premultiplied once when rebuilt.
+    return pygame.Surface(rect.size, pygame.SRCALPHA)
+
+def opaque(color):
+    # The window surface ignores per-pixel alpha, so overlay shapes always drew opaque.
+    return color[:3]
+
+class ProfilerOverlay:
+    """The profiler's stage and counter table, rebuilt every `profiler.refresh` seconds."""
+    
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.layer = UILayer()
+        self.surface_time = 0.0
+    
+    def reset(self):
+        self.layer.key = None
+    
+    def update_layer(self):
+        now = time.perf_counter()
+        if self.layer.key is None or now - self.surface_time >= self.profiler.refresh:
+            self.surface_time = now
+        
+        def build():
+            surface = self.render()
+            return surface, surface.get_rect(topleft=(10, 120))
+        return self.layer.update(self.surface_time, build)
+    
+    def draw(self, screen):
+        if self.profiler.overlay:
+            self.update_layer().blit(screen)
+    
+    def render(self):
+        rows = [('stage', 'mean ms', 'max ms')]
+        for name, (mean, peak) in self.profiler.summary().items():
+            rows.append((name, f"{mean:.2f}", f"{peak:.2f}"))
+        for name, value in self.profiler.frame_counters.items():
+            rows.append((name, '', str(value)))
+        
+        font = text_cache.font(18)
+        line_height = font.get_linesize()
+        surface = pygame.Surface((260, line_height * len(rows) + 8), pygame.SRCALPHA)
+        surface.fill((0, 0, 0, 160))
+        for row, cells in enumerate(rows):
+            y = 4 + row * line_height
+            surface.blit(font.render(cells[0], True, YELLOW), (6, y))
+            for right, cell in zip((190, 254), cells[1:]):
+                text = font.render(cell, True, YELLOW)
+                surface.blit(text, (right - text.get_width(), y))
+        return surface
+
+profiler_overlay = ProfilerOverlay(profiler)
+
+class TouchControl:
+    def __init__(self):
+        self.left_stick_active = False
+        self.left_stick_pos = (0, 0)
+        self.left_stick_delta = (0, 0)
+        self.left_touch_id = None
+        
+        self.right_stick_active = False
+        self.right_stick_pos = (0, 0)
+        self.right_stick_delta = (0, 0)
+        self.right_touch_id = None
+        
+        self.shoot_button_pressed = False
+        self.layers = (UILayer(), UILayer(), UILayer())
+        
+    def update(self, events, display):
+        self.shoot_button_pressed = False
+        
+        for event in events:
+            if event.type == pygame.FINGERDOWN:
+                x = event.x * display.width
+                y = event.y * display.height
+                
+                if x < display.width / 2:
+                    self.left_stick_active = True
+                    self.left_stick_pos = (x, y)
+                    self.left_touch_id = event.finger_id
+                else:
+                    if self.is_shoot_button(x, y, display):
+                        self.shoot_button_pressed = True
+                    else:
+                        self.right_stick_active = True
+                        self.right_stick_pos = (x, y)
+                        self.right_touch_id = event.finger_id
+                        
+            elif event.type == pygame.FINGERUP:
+                if event.finger_id == self.left_touch_id:
+                    self.left_stick_active = False
+                    self.left_stick_delta = (0, 0)
+                    self.left_touch_id = None
+                elif event.finger_id == self.right_touch_id:
+                    self.right_stick_active = False
+                    self.right_stick_delta = (0, 0)
+                    self.right_touch_id = None
+                    
+            elif event.type == pygame.FINGERMOTION:
+                x = event.x * display.width
+                y = event.y * display.height
+                
+                if event.finger_id == self.left_touch_id and self.left_stick_active:
+                    dx = x - self.left_stick_pos[0]
+                    dy = y - self.left_stick_pos[1]
+                    max_dist = 50
+                    dist = math.sqrt(dx**2 + dy**2)
+                    if dist > max_dist:
+                        dx = dx / dist * max_dist
+                        dy = dy / dist * max_dist
+                    self.left_stick_delta = (dx, dy)
+                    
+                elif event.finger_id == self.right_touch_id and self.right_stick_active:
+                    dx = x - self.right_stick_pos[0]
+                    dy = y - self.right_stick_pos[1]
+                    max_dist = 50
+                    dist = math.sqrt(dx**2 + dy**2)
+                    if dist > max_dist:
+                        dx = dx / dist * max_dist
+                        dy = dy / dist * max_dist
+                    self.right_stick_delta = (dx, dy)
+    
+    def is_shoot_button(self, x, y, display):
+        button_size = 80
+        button_x = display.width - button_size - 20
+        button_y = display.height - button_size - 20
+        return button_x <= x <= button_x + button_size and button_y <= y <= button_y + button_size
+    
+    def stick_layer(self, layer, active, center, delta, resting):
+        if active:
+            key = (True, center, delta)
+        else:
+            key = (False, resting)
+        
+        def build():
+            if not active and resting is None:
+                return None, None
+            origin = center if active else resting
+            rect = pygame.Rect(int(origin[0]) - 81, int(origin[1]) - 81, 163, 163)
+            surface = layer_canvas(rect)
+            local = (origin[0] - rect.x, origin[1] - rect.y)
+            if active:
+                pygame.draw.circle(surface, opaque((100, 100, 100, 100)), local, 60, 2)
+                pygame.draw.circle(surface, opaque((200, 200, 200, 150)), (local[0] + delta[0], local[1] + delta[1]), 30)
+            else:
+                pygame.draw.circle(surface, opaque((80, 80, 80, 80)), local, 60, 2)
+            return surface, rect
+        return layer.update(key, build)
+    
+    def button_layer(self, display):
+        button_size = 80
+        button_x = display.width - button_size - 20
+        button_y = display.height - button_size - 20
+        pressed = self.shoot_button_pressed
+        
+        def build():
+            rect = pygame.Rect(button_x, button_y, button_size, button_size)
+            surface = layer_canvas(rect)
+            color = RED if pressed else (150, 0, 0)
+            pygame.draw.circle(surface, color, (button_size // 2, button_size // 2), button_size // 2)
+            text = text_cache.render("FIRE", 36, WHITE)
+            surface.blit(text, text.get_rect(center=(button_size // 2, button_size // 2)))
+            return surface, rect
+        return self.layers[2].update((pressed, button_x, button_y), build)
+    
+    def update_layers(self, display):
+        return (self.stick_layer(self.layers[0], self.left_stick_active, self.left_stick_pos,
+                                 self.left_stick_delta, (80, display.height - 80)),
+                self.stick_layer(self.layers[1], self.right_stick_active, self.right_stick_pos,
+                                 self.right_stick_delta, None),
+                self.button_layer(display))
+    
+    def draw(self, screen, display):
+        for layer in self.update_layers(display):
+            layer.blit(screen)
+
+class MinimapLayer:
+    def __init__(self, view_tiles=32):
+        self.view_tiles = view_tiles
+        self.surface = None
+        self.key = None
+        self.renders = 0
+        self.layer = UILayer()
+    
+    def layout(self, display):
+        if display.is_portrait:
+            minimap_size = min(display.width - 20, 120)
+            minimap_x = (display.width - minimap_size) // 2
+            minimap_y = 10
+        else:
+            minimap_size = 150
+            minimap_x = display.width - minimap_size - 10
+            minimap_y = 10
+        return minimap_x, minimap_y, minimap_size
+    
+    def is_windowed(self):
+        return max(game_map.level.width, game_map.level.height) > self.view_tiles
+    
+    def window_origin(self, player):
+        tiles = self.view_tiles + 2
+        origin_x = min(max(int(player.x) - tiles // 2, 0), max(game_map.level.width - tiles, 0))
+        origin_y = min(max(int(player.y) - tiles // 2, 0), max(game_map.level.height - tiles, 0))
+        return origin_x, origin_y
+    
+    def static_layer(self, player, minimap_size):
+        if self.is_windowed():
+            origin = self.window_origin(player)
+        else:
+            origin = (0, 0)
+        key = (game_map.level.version, minimap_size, origin)
+        if key != self.key:
+            self.surface = self.render(minimap_size, origin)
+            self.key = key
+            self.renders += 1
+        return self.surface, origin
+    
+    def render(self, minimap_size, origin):
+        if not self.is_windowed():
+            minimap_scale = minimap_size / max(game_map.level.width, game_map.level.height)
+            surface = pygame.Surface((minimap_size + 4, minimap_size + 4))
+            surface.fill(BLACK)
+            for y in range(game_map.level.height):
+                for x in range(game_map.level.width):
+                    if game_map.level.tile(x, y) == 1:
+                        pygame.draw.rect(surface, WHITE, 
+                                       (2 + x * minimap_scale, 
+                                        2 + y * minimap_scale, 
+                                        minimap_scale, minimap_scale))
+            return surface
+        
+        minimap_scale = minimap_size / self.view_tiles
+        tiles = self.view_tiles + 2
+        origin_x, origin_y = origin
+        window = np.zeros((tiles, tiles), dtype=np.uint8)
+        visible = game_map.level.window(origin_x, origin_y, origin_x + tiles, origin_y + tiles)
+        window[:visible.shape[0], :visible.shape[1]] = visible
+        
+        pixels = np.where(window.T[:, :, None] == 1, np.array(WHITE, dtype=np.uint8), np.array(BLACK, dtype=np.uint8))
+        tile_surface = pygame.surfarray.make_surface(pixels)
+        size = int(round(tiles * minimap_scale))
+        return pygame.transform.scale(tile_surface, (size, size))
+    
+    def update_layer(self, player, enemies, display):
+        minimap_x, minimap_y, minimap_size = self.layout(display)
+        surface, (origin_x, origin_y) = self.static_layer(player, minimap_size)
+        
+        if not self.is_windowed():
+            minimap_scale = minimap_size / max(game_map.level.width, game_map.level.height)
+            left, top = minimap_x, minimap_y
+            blit_at = (minimap_x - 2, minimap_y - 2)
+            windowed = False
+        else:
+            minimap_scale = minimap_size / self.view_tiles
+            left = minimap_x - (player.x - self.view_tiles / 2 - origin_x) * minimap_scale
+            top = minimap_y - (player.y - self.view_tiles / 2 - origin_y) * minimap_scale
+            blit_at = (int(left), int(top))
+            left -= origin_x * minimap_scale
+            top -= origin_y * minimap_scale
+            windowed = True
+        
+        player_minimap_x = left + player.x * minimap_scale
+        player_minimap_y = top + player.y * minimap_scale
+        line_length = 10
+        end_x = player_minimap_x + math.cos(player.angle) * line_length
+        end_y = player_minimap_y + math.sin(player.angle) * line_length
+        marker = (int(player_minimap_x), int(player_minimap_y))
+        line = (marker, (int(end_x), int(end_y)))
+        
+        enemy_x, enemy_y, _ = sprite_positions(enemies)
+        enemy_x = left + enemy_x * minimap_scale
+        enemy_y = top + enemy_y * minimap_scale
+        if windowed:
+            inside = ((minimap_x <= enemy_x) & (enemy_x < minimap_x + minimap_size) &
+                      (minimap_y <= enemy_y) & (enemy_y < minimap_y + minimap_size))
+            enemy_x, enemy_y = enemy_x[inside], enemy_y[inside]
+        dots = np.stack([enemy_x, enemy_y], axis=1).astype(np.int32)
+        
+        def build():
+            rect = pygame.Rect(minimap_x - 2, minimap_y - 2, minimap_size + 4, minimap_size + 4)
+            canvas = layer_canvas(rect)
+            if windowed:
+                canvas.fill(BLACK)
+                canvas.set_clip(pygame.Rect(2, 2, minimap_size, minimap_size))
+            canvas.blit(surface, (blit_at[0] - rect.x, blit_at[1] - rect.y))
+            shift = lambda point: (point[0] - rect.x, point[1] - rect.y)
+            pygame.draw.circle(canvas, GREEN, shift(marker), 3)
+            pygame.draw.line(canvas, GREEN, shift(line[0]), shift(line[1]), 2)
+            for dot in dots.tolist():
+                pygame.draw.circle(canvas, RED, shift(dot), 2)
+            canvas.set_clip(None)
+            return canvas, rect
+        
+        key = (self.key, blit_at, marker, line, dots.tobytes())
+        return self.layer.update(key, build)
+    
+    def draw(self, screen, player, enemies, display):
+        self.update_layer(player, enemies, display).blit(screen)
+
+minimap_layer = MinimapLayer()
+
+def draw_minimap(screen, player, enemies, display):
+    minimap_layer.draw(screen, player, enemies, display)
+
+hud_layer = UILayer()
+crosshair_layer = UILayer()
+banner_layer = UILayer()
+message_layer = UILayer()
+
+def update_hud(player, enemies, display):
+    font_size = min(36, display.width // 20)
+    small_font_size = min(24, display.width // 30)
+    y_offset = display.height - 150 if display.is_portrait else 10
+    health = player.health
+    ammo = player.ammo
+    enemies_alive = count_alive(enemies)
+    
+    def build_stats():
+        lines = [(text_cache.render(f"HP: {health}", font_size, GREEN if health > 30 else RED), 0),
+                 (text_cache.render(f"Ammo: {ammo}", font_size, YELLOW), 40),
+                 (text_cache.render(f"Enemies: {enemies_alive}", small_font_size, WHITE), 80)]
+        rect = pygame.Rect(10, y_offset, 0, 0).unionall(
+            [text.get_rect(topleft=(10, y_offset + offset)) for text, offset in lines])
+        surface = layer_canvas(rect)
+        for text, offset in lines:
+            surface.blit(text, (10 - rect.x, y_offset + offset - rect.y))
+        return surface, rect
+    
+    crosshair_size = 10
+    
+    def build_crosshair():
+        rect = pygame.Rect(display.width // 2 - crosshair_size, display.height // 2 - crosshair_size,
+                           crosshair_size * 2, crosshair_size * 2)
+        surface = layer_canvas(rect)
+        pygame.draw.rect(surface, WHITE, (crosshair_size - 2, 0, 4, crosshair_size * 2))
+        pygame.draw.rect(surface, WHITE, (0, crosshair_size - 2, crosshair_size * 2, 4))
+        return surface, rect
+    
+    return (hud_layer.update((health, ammo, enemies_alive, font_size, small_font_size, y_offset), build_stats),
+            crosshair_layer.update((display.width, display.height), build_crosshair))
+
+def draw_hud(screen, player, enemies, display):
+    for layer in update_hud(player, enemies, display):
+        layer.blit(screen)
+
+def update_end_screen(display, title, color):
+    def build():
+        font_size = min(72, display.width // 10)
+        text = text_cache.render(title, font_size, color)
+        text_rect = text.get_rect(center=(display.width // 2, display.height // 2))
+        
+        small_font_size = min(36, display.width // 20)
+        restart_text = text_cache.render("Press ESC to exit", small_font_size, WHITE)
+        restart_rect = restart_text.get_rect(center=(display.width // 2, display.height // 2 + 60))
+        
+        rect = text_rect.union(restart_rect)
+        surface = layer_canvas(rect)
+        surface.blit(text, text_rect.move(-rect.x, -rect.y))
+        surface.blit(restart_text, restart_rect.move(-rect.x, -rect.y))
+        return surface, rect
+    return banner_layer.update((title, color, display.width, display.height), build)
+
+def update_message(display, text, color):
+    """A one-line notice along the top edge, such as a quickload that failed."""
+    def build():
+        font_size = min(28, display.width // 28)
+        rendered = text_cache.render(text, font_size, color)
+        rect = rendered.get_rect(midtop=(display.width // 2, 10))
+        surface = layer_canvas(rect)
+        surface.blit(rendered, (0, 0))
+        return surface, rect
+    return message_layer.update((text, color, display.width), build)
+
+def draw_end_screen(screen, display, title, color):
+    update_end_screen(display, title, color).blit(screen)
+
+def scene_key(player, enemies, display):
+    if isinstance(enemies, EnemyPool):
+        count = enemies.count
+        positions = (enemies.x[:count].tobytes(), enemies.y[:count].tobytes(), enemies.alive[:count].tobytes())
+    else:
+        positions = tuple((enemy.x, enemy.y, enemy.alive) for enemy in enemies)
+    return (player.x, player.y, player.angle, positions, game_map.level.version, display.width, display.height,
+            display.render_scale(), display.render_mode, display.textured)
+
+class Compositor:
+    """Puts the 3D scene and the UI layers on screen, pushing only what changed.
+    
+    A frame whose scene key changed is drawn in full and flipped. Otherwise
+    the scene is left alone: regions under layers that were rebuilt, added
+    or removed are restored from a saved copy of the scene, the layers
+    touching them are re-blitted clipped to those regions, and only those
+    rects go to pygame.display.update().
+    """
+    
+    def __init__(self):
+        self.scene = None
+        self.scene_key = None
+        self.full = True
+        self.drawn = {}
+        self.full_frames = 0
+        self.partial_frames = 0
+        self.idle_frames = 0
+    
+    def needs_scene(self, screen, key):
+        if self.scene is None or self.scene.get_size() != screen.get_size() or key != self.scene_key:
+            self.scene_key = key
+            self.full = True
+        return self.full
+    
+    def capture(self, screen):
+        if self.scene is None or self.scene.get_size() != screen.get_size():
+            self.scene = pygame.Surface(screen.get_size(), 0, screen)
+        self.scene.blit(screen, (0, 0))
+    
+    def invalidate(self):
+        self.scene_key = None
+        self.full = True
+    
+    def present(self, screen, layers, display):
+        visible = [layer for layer in layers if layer.visible]
+        
+        if self.full:
+            for layer in visible:
+                layer.blit(screen)
+            pygame.display.flip()
+            self.full_frames += 1
+        else:
+            current = {id(layer) for layer in visible}
+            dirty = [rect for key, (layer, rect) in self.drawn.items() if key not in current or layer.dirty]
+            for layer in visible:
+                if (layer.dirty or id(layer) not in self.drawn) and layer.rect not in dirty:
+                    dirty.append(layer.rect)
+            for rect in dirty:
+                screen.blit(self.scene, rect, rect)
+                screen.set_clip(rect)
+                for layer in visible:
+                    if layer.rect.colliderect(rect):
+                        layer.blit(screen)
+            screen.set_clip(None)
+            
+            if not dirty:
+                self.idle_frames += 1
+            elif display.dirty_rects:
+                pygame.display.update(dirty)
+                self.partial_frames += 1
+            else:
+                pygame.display.flip()
+                self.partial_frames += 1
+        
+        for layer in layers:
+            layer.dirty = False
+        self.drawn = {id(layer): (layer, layer.rect.copy()) for layer in visible}
+        self.full = False
+
+compositor = Compositor()
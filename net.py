@@ -0,0 +1,607 @@
+import argparse
+import math
+import random
+import socket
+import struct
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from fps import map as game_map
+from fps.constants import FPS, TICK_RATE
+from fps.map import load_level
+from fps.input import FIRE, TURN_LEFT, TURN_RIGHT, TURN_SPEED, action_keys, keys_action
+from fps.raycaster import VisibilityTable, visibility
+from fps.entities import EnemyList, EnemyPool, FlowField, Player, shoot
+
+HELLO = 1
+WELCOME = 2
+INPUT = 3
+BYE = 4
+SNAPSHOT = 5
+
+PACKET_TYPE = struct.Struct('<B')
+# type, client id, tick rate, player start x/y
+WELCOME_FORMAT = struct.Struct('<BHHff')
+# type, client id, last snapshot tick received, input count
+INPUT_HEADER = struct.Struct('<BHIB')
+# input sequence, buttons, turn in milliradians
+INPUT_ENTRY = struct.Struct('<IBh')
+# type, tick, baseline tick (0 = full), last input applied, own x/y/angle/health/ammo,
+# removed entity count, changed entity count
+SNAPSHOT_HEADER = struct.Struct('<BIIIfffhhHH')
+ENTITY_ID = struct.Struct('<H')
+
+KIND_ENEMY = 0
+KIND_PLAYER = 1
+PLAYER_ID_BASE = 0x8000
+
+# Entity fields in wire order: kind u8, x u16, y u16, angle u8, health u8.
+# Positions are fixed point at 1/64 tile, so maps up to 1024 tiles across fit.
+FIELD_FORMATS = ('B', 'H', 'H', 'B', 'B')
+POSITION_SCALE = 64
+ANGLE_SCALE = 256 / (2 * math.pi)
+ENTITY_FORMATS = {}
+for mask in range(1 << len(FIELD_FORMATS)):
+    ENTITY_FORMATS[mask] = struct.Struct('<HB' + ''.join(
+        code for bit, code in enumerate(FIELD_FORMATS) if mask & (1 << bit)))
+FULL_MASK = (1 << len(FIELD_FORMATS)) - 1
+
+MAX_INPUTS = 4
+HISTORY = 64
+TIMEOUT = 5.0
+
+def quantize(kind, x, y, angle, health):
+    return (kind,
+            min(max(int(round(x * POSITION_SCALE)), 0), 0xFFFF),
+            min(max(int(round(y * POSITION_SCALE)), 0), 0xFFFF),
+            int(round(angle * ANGLE_SCALE)) & 0xFF,
+            min(max(int(health), 0), 0xFF))
+
+def encode_snapshot(tick, baseline_tick, baseline, state, input_sequence, player):
+    removed = [entity for entity in baseline if entity not in state]
+    records = []
+    for entity, values in state.items():
+        old = baseline.get(entity)
+        if old == values:
+            continue
+        mask = 0
+        fields = []
+        for bit, value in enumerate(values):
+            if old is None or old[bit] != value:
+                mask |= 1 << bit
+                fields.append(value)
+        records.append(ENTITY_FORMATS[mask].pack(entity, mask, *fields))
+
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT, tick, baseline_tick, input_sequence,
+                                  player.x, player.y, player.angle, player.health, player.ammo,
+                                  len(removed), len(records))
+    return b''.join([header] + [ENTITY_ID.pack(entity) for entity in removed] + records)
+
+def decode_snapshot(data, baselines):
+    """Returns (tick, own state, last input applied, entity dict), or None if the baseline is unknown.
+
+    Raises struct.error for a packet too short for its counts or with an unknown field mask.
+    """
+    (_, tick, baseline_tick, input_sequence, x, y, angle, health, ammo,
+     removed_count, changed_count) = SNAPSHOT_HEADER.unpack_from(data)
+    if baseline_tick:
+        if baseline_tick not in baselines:
+            return None
+        state = dict(baselines[baseline_tick])
+    else:
+        state = {}
+
+    offset = SNAPSHOT_HEADER.size
+    for _ in range(removed_count):
+        state.pop(ENTITY_ID.unpack_from(data, offset)[0], None)
+        offset += ENTITY_ID.size
+    for _ in range(changed_count):
+        entity, mask = struct.unpack_from('<HB', data, offset)
+        layout = ENTITY_FORMATS.get(mask)
+        if layout is None:
+            raise struct.error(f"unknown field mask {mask:#x}")
+        values = layout.unpack_from(data, offset)[2:]
+        offset += layout.size
+        if mask == FULL_MASK:
+            state[entity] = values
+            continue
+        old = state.get(entity, (0, 0, 0, 0, 0))
+        fields = iter(values)
+        state[entity] = tuple(next(fields) if mask & (1 << bit) else old[bit] for bit in range(len(old)))
+    return tick, (x, y, angle, health, ammo), input_sequence, state
+
+def apply_input(player, enemies, buttons, turn, time_scale):
+    """One client tick of input. The server and client prediction both go through here."""
+    if buttons & FIRE and enemies is not None:
+        shoot(player, enemies)
+    player.angle += turn / 1000
+    spin = bool(buttons & TURN_RIGHT) - bool(buttons & TURN_LEFT)
+    player.angle = (player.angle + spin * TURN_SPEED * time_scale) % (2 * math.pi)
+    player.move(action_keys(buttons), enemies if enemies is not None else (), None, time_scale)
+
+class ServerClient:
+    def __init__(self, client_id, address, player):
+        self.id = client_id
+        self.address = address
+        self.player = player
+        self.field = FlowField()
+        self.inputs = {}
+        self.last_sequence = 0
+        self.ack = 0
+        self.sent = OrderedDict()
+        self.last_heard = time.monotonic()
+        self.bytes_sent = 0
+        self.packets_sent = 0
+        self.full_snapshots = 0
+
+class Server:
+    """Authoritative headless world for any number of UDP clients.
+
+    Each tick drains client inputs, steps players and enemies, then sends
+    every client one snapshot. The snapshot carries the client's own state
+    in full. Other entities are filtered by distance and the PVS, and are
+    delta-encoded against the newest snapshot that client acknowledged.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, tick_rate=30, enemy_count=None,
+                 interest_radius=12.0, near_radius=3.0, respawn_seconds=5.0, seed=0):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+        self.socket.bind((host, port))
+        self.socket.setblocking(False)
+        self.address = self.socket.getsockname()
+
+        self.tick_rate = tick_rate
+        self.time_scale = FPS / tick_rate
+        self.interest_radius = interest_radius
+        self.near_radius = near_radius
+        self.respawn_ticks = int(respawn_seconds * tick_rate)
+        self.rng = random.Random(seed)
+
+        spawns = list(game_map.level.spawns)
+        if enemy_count is not None:
+            spawns = spawns[:enemy_count]
+        if enemy_count is not None and len(spawns) < enemy_count:
+            # Only padding needs the floor tiles, so big levels with spawns enough never scan for them.
+            free_y, free_x = np.nonzero(game_map.level.to_array() == 0)
+            free_tiles = list(zip(free_x.tolist(), free_y.tolist()))
+            while len(spawns) < enemy_count:
+                x, y = self.rng.choice(free_tiles)
+                spawns.append((x + 0.5, y + 0.5))
+        self.spawns = spawns
+        self.enemies = EnemyPool.from_positions(spawns)
+        self.died = np.full(len(self.enemies), -1, dtype=np.int64)
+
+        self.clients = {}
+        self.by_address = {}
+        self.next_id = 1
+        self.tick = 0
+        self.tick_times = deque(maxlen=max(tick_rate * 60, 1))
+        self.started = time.monotonic()
+        visibility.ensure()
+
+    def poll(self):
+        while True:
+            try:
+                data, address = self.socket.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionResetError:
+                continue
+            if not data:
+                continue
+            kind = data[0]
+            # Anyone can send anything; a malformed packet is dropped, never fatal.
+            try:
+                if kind == HELLO:
+                    self.accept(address)
+                elif kind == INPUT and len(data) >= INPUT_HEADER.size:
+                    self.receive_input(data, address)
+                elif kind == BYE:
+                    client = self.by_address.get(address)
+                    if client:
+                        self.drop(client)
+            except struct.error:
+                continue
+
+    def accept(self, address):
+        client = self.by_address.get(address)
+        if client is None:
+            client = ServerClient(self.next_id, address, Player(*game_map.level.player_start))
+            self.next_id += 1
+            self.clients[client.id] = client
+            self.by_address[address] = client
+        start_x, start_y = game_map.level.player_start
+        self.socket.sendto(WELCOME_FORMAT.pack(WELCOME, client.id, self.tick_rate, start_x, start_y), address)
+
+    def receive_input(self, data, address):
+        _, client_id, ack, count = INPUT_HEADER.unpack_from(data)
+        client = self.clients.get(client_id)
+        if client is None or client.address != address:
+            return
+        client.last_heard = time.monotonic()
+        client.ack = max(client.ack, ack)
+        offset = INPUT_HEADER.size
+        # Only as many entries as the packet actually holds, whatever its header claims.
+        count = min(count, MAX_INPUTS, (len(data) - INPUT_HEADER.size) // INPUT_ENTRY.size)
+        for _ in range(count):
+            sequence, buttons, turn = INPUT_ENTRY.unpack_from(data, offset)
+            offset += INPUT_ENTRY.size
+            if sequence > client.last_sequence:
+                client.inputs[sequence] = (buttons, turn)
+
+    def drop(self, client):
+        del self.clients[client.id]
+        del self.by_address[client.address]
+
+    def step(self):
+        start = time.perf_counter()
+        self.poll()
+
+        now = time.monotonic()
+        for client in list(self.clients.values()):
+            if now - client.last_heard > TIMEOUT:
+                self.drop(client)
+                continue
+            # Late packets can carry several inputs; apply at most MAX_INPUTS a tick, in order.
+            for sequence in sorted(client.inputs)[:MAX_INPUTS]:
+                buttons, turn = client.inputs.pop(sequence)
+                apply_input(client.player, self.enemies, buttons, turn, self.time_scale)
+                client.last_sequence = sequence
+            client.inputs = {sequence: entry for sequence, entry in client.inputs.items()
+                             if sequence > client.last_sequence}
+
+        self.step_enemies()
+        self.respawn()
+        self.tick += 1
+        self.broadcast()
+        self.tick_times.append((time.perf_counter() - start) * 1000)
+
+    def step_enemies(self):
+        clients = list(self.clients.values())
+        index = self.enemies.alive_indices()
+        if not clients or not index.size:
+            return
+        self.enemies.begin_tick()
+        player_x = np.array([client.player.x for client in clients])
+        player_y = np.array([client.player.y for client in clients])
+        distance = ((self.enemies.x[index, None] - player_x)**2 + (self.enemies.y[index, None] - player_y)**2)
+        nearest = np.argmin(distance, axis=1)
+        for slot in np.unique(nearest):
+            client = clients[slot]
+            self.enemies.step(client.player, self.time_scale, index[nearest == slot], client.field)
+
+    def respawn(self):
+        for client in self.clients.values():
+            if client.player.health <= 0:
+                client.player = Player(*game_map.level.player_start)
+
+        dead = ~self.enemies.alive[:len(self.enemies)]
+        self.died[dead & (self.died < 0)] = self.tick
+        self.died[~dead] = -1
+        for index in np.flatnonzero(dead & (self.died >= 0) & (self.tick - self.died >= self.respawn_ticks)):
+            x, y = self.spawns[index]
+            self.enemies.x[index] = self.enemies.prev_x[index] = x
+            self.enemies.y[index] = self.enemies.prev_y[index] = y
+            self.enemies.health[index] = 50
+            self.enemies.alive[index] = True
+            self.enemies.cooldown[index] = 0
+            self.died[index] = -1
+
+    def entities(self):
+        """All entities this tick as (ids, x, y, quantized tuples)."""
+        index = self.enemies.alive_indices()
+        ids = index.tolist()
+        xs = self.enemies.x[index].astype(np.float64).tolist()
+        ys = self.enemies.y[index].astype(np.float64).tolist()
+        values = [quantize(KIND_ENEMY, x, y, 0.0, health)
+                  for x, y, health in zip(xs, ys, self.enemies.health[index].tolist())]
+        for client in self.clients.values():
+            player = client.player
+            ids.append(PLAYER_ID_BASE + client.id)
+            xs.append(player.x)
+            ys.append(player.y)
+            values.append(quantize(KIND_PLAYER, player.x, player.y, player.angle, player.health))
+        return np.array(ids, dtype=np.int64), np.array(xs), np.array(ys), values
+
+    def interest(self, client, ids, xs, ys):
+        player = client.player
+        distance_sq = (xs - player.x)**2 + (ys - player.y)**2
+        candidates = np.flatnonzero((distance_sq < self.interest_radius**2) & (ids != PLAYER_ID_BASE + client.id))
+        tile_x = int(player.x)
+        tile_y = int(player.y)
+        near = self.near_radius**2
+        return [i for i in candidates.tolist()
+                if distance_sq[i] < near or visibility.visible(tile_x, tile_y, int(xs[i]), int(ys[i]))]
+
+    def broadcast(self):
+        ids, xs, ys, values = self.entities()
+        id_list = ids.tolist()
+        for client in self.clients.values():
+            state = {id_list[i]: values[i] for i in self.interest(client, ids, xs, ys)}
+            baseline = client.sent.get(client.ack)
+            if baseline is None:
+                baseline_tick, baseline = 0, {}
+                client.full_snapshots += 1
+            else:
+                baseline_tick = client.ack
+            data = encode_snapshot(self.tick, baseline_tick, baseline, state, client.last_sequence, client.player)
+            try:
+                self.socket.sendto(data, client.address)
+            except (BlockingIOError, InterruptedError):
+                continue
+            client.bytes_sent += len(data)
+            client.packets_sent += 1
+            client.sent[self.tick] = state
+            while len(client.sent) > HISTORY:
+                client.sent.popitem(last=False)
+
+    def run(self, duration=None):
+        interval = 1 / self.tick_rate
+        deadline = time.perf_counter()
+        end = None if duration is None else deadline + duration
+        while end is None or deadline < end:
+            self.step()
+            deadline += interval
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline = time.perf_counter()
+
+    def stats(self):
+        times = np.array(self.tick_times) if self.tick_times else np.zeros(1)
+        return {
+            "ticks": self.tick,
+            "clients": len(self.clients),
+            "tick_mean_ms": float(times.mean()),
+            "tick_p95_ms": float(np.percentile(times, 95)),
+            "tick_max_ms": float(times.max()),
+            "bytes_sent": sum(client.bytes_sent for client in self.clients.values()),
+            "full_snapshots": sum(client.full_snapshots for client in self.clients.values()),
+            "packets_sent": sum(client.packets_sent for client in self.clients.values()),
+        }
+
+    def close(self):
+        self.socket.close()
+
+class RemoteEntity:
+    # grid and cell belong to the SpatialGrid of the EnemyList the renderer builds.
+    __slots__ = ('id', 'kind', 'sprite', 'x', 'y', 'angle', 'health', 'alive', 'grid', 'cell')
+
+    def __init__(self, entity, kind, x, y, angle, health):
+        self.id = entity
+        self.kind = kind
+        self.sprite = 'player' if kind == KIND_PLAYER else 'enemy'
+        self.x = x
+        self.y = y
+        self.angle = angle
+        self.health = health
+        self.alive = True
+        self.grid = None
+        self.cell = None
+
+class Client:
+    """UDP client with local prediction for its own player and interpolation for everything else.
+
+    Inputs are applied locally as soon as they are sent. Each snapshot resets
+    the player to the server's state and replays the inputs the server has
+    not applied yet. Other entities are drawn `interpolation_ticks` behind the
+    newest snapshot, blended between the two snapshots around that time.
+    """
+
+    def __init__(self, server_address, interpolation_ticks=2):
+        self.server_address = server_address
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(('127.0.0.1' if server_address[0] in ('127.0.0.1', 'localhost') else '', 0))
+        self.socket.setblocking(False)
+        self.interpolation_ticks = interpolation_ticks
+        self.id = None
+        self.tick_rate = TICK_RATE
+        self.time_scale = 1.0
+        self.player = Player(*game_map.level.player_start)
+        self.sequence = 0
+        self.pending = deque()
+        self.snapshots = OrderedDict()
+        self.latest_tick = 0
+        self.latest_time = 0.0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.snapshots_received = 0
+        self.correction = 0.0
+
+    def connect(self, timeout=5.0):
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            self.socket.sendto(PACKET_TYPE.pack(HELLO), self.server_address)
+            wait = time.monotonic() + 0.1
+            while time.monotonic() < wait:
+                try:
+                    data = self.socket.recv(2048)
+                except (BlockingIOError, InterruptedError):
+                    time.sleep(0.005)
+                    continue
+                if data and data[0] == WELCOME:
+                    _, self.id, self.tick_rate, start_x, start_y = WELCOME_FORMAT.unpack_from(data)
+                    self.time_scale = FPS / self.tick_rate
+                    self.player = Player(start_x, start_y)
+                    return True
+        return False
+
+    def send_input(self, buttons, turn=0):
+        self.sequence += 1
+        turn = max(-32768, min(32767, int(turn)))
+        self.pending.append((self.sequence, buttons, turn))
+        apply_input(self.player, None, buttons, turn, self.time_scale)
+        # Repeat the newest few unacknowledged inputs so single lost packets cost nothing.
+        recent = list(self.pending)[-MAX_INPUTS:]
+        data = INPUT_HEADER.pack(INPUT, self.id, self.latest_tick, len(recent)) + b''.join(
+            INPUT_ENTRY.pack(*entry) for entry in recent)
+        self.socket.sendto(data, self.server_address)
+        self.bytes_sent += len(data)
+
+    def poll(self):
+        while True:
+            try:
+                data = self.socket.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionResetError:
+                continue
+            if data and data[0] == SNAPSHOT:
+                self.bytes_received += len(data)
+                try:
+                    self.receive_snapshot(data)
+                except struct.error:
+                    continue
+
+    def receive_snapshot(self, data):
+        decoded = decode_snapshot(data, self.snapshots)
+        if decoded is None:
+            return
+        tick, (x, y, angle, health, ammo), input_sequence, state = decoded
+        self.snapshots_received += 1
+        if tick <= self.latest_tick:
+            return
+        self.snapshots[tick] = state
+        while len(self.snapshots) > HISTORY:
+            self.snapshots.popitem(last=False)
+        self.latest_tick = tick
+        self.latest_time = time.perf_counter()
+
+        predicted = (self.player.x, self.player.y)
+        self.player.x, self.player.y, self.player.angle = x, y, angle
+        self.player.health, self.player.ammo = health, ammo
+        while self.pending and self.pending[0][0] <= input_sequence:
+            self.pending.popleft()
+        for _, buttons, turn in self.pending:
+            apply_input(self.player, None, buttons, turn, self.time_scale)
+        self.correction = math.hypot(self.player.x - predicted[0], self.player.y - predicted[1])
+
+    def entities(self, now=None):
+        if not self.snapshots:
+            return []
+        now = time.perf_counter() if now is None else now
+        render_tick = self.latest_tick - self.interpolation_ticks + (now - self.latest_time) * self.tick_rate
+        ticks = list(self.snapshots)
+        after = next((tick for tick in ticks if tick >= render_tick), ticks[-1])
+        before = max((tick for tick in ticks if tick <= render_tick), default=after)
+        alpha = 0.0 if after == before else (render_tick - before) / (after - before)
+
+        start = self.snapshots[before]
+        end = self.snapshots[after]
+        entities = []
+        for entity, (kind, x, y, angle, health) in end.items():
+            old = start.get(entity)
+            if old is not None:
+                x = old[1] + (x - old[1]) * alpha
+                y = old[2] + (y - old[2]) * alpha
+            entities.append(RemoteEntity(entity, kind, x / POSITION_SCALE, y / POSITION_SCALE,
+                                         angle / ANGLE_SCALE, health))
+        return entities
+
+    def close(self):
+        if self.id is not None:
+            self.socket.sendto(PACKET_TYPE.pack(BYE), self.server_address)
+        self.socket.close()
+
+def draw_frame(screen, client, display):
+    """Draw one client frame: the world and HUD around the predicted player."""
+    from fps.rendering import render_3d
+    from fps.ui import draw_hud, draw_minimap
+
+    others = EnemyList(client.entities())
+    render_3d(screen, client.player, others, display)
+    draw_minimap(screen, client.player, others, display)
+    draw_hud(screen, client.player, others, display)
+
+def play(address, level_path=None):
+    # Only the client draws; the server and the load test never load pygame.
+    import pygame
+    from fps.app import init
+    from fps.rendering import DisplayConfig
+    from fps.ui import text_cache
+
+    init()
+    if level_path:
+        load_level(level_path)
+    client = Client(address)
+    display = DisplayConfig()
+    screen = pygame.display.set_mode((display.width, display.height), pygame.RESIZABLE)
+    pygame.display.set_caption("FPS - Multiplayer")
+    if not client.connect():
+        raise SystemExit(f"no answer from {address[0]}:{address[1]}")
+    visibility.ensure(VisibilityTable.cache_path_for(level_path) if level_path else None)
+    pygame.mouse.set_visible(False)
+    pygame.event.set_grab(True)
+
+    clock = pygame.time.Clock()
+    interval = 1 / client.tick_rate
+    accumulator = 0.0
+    turn = 0.0
+    fire = False
+    running = True
+    while running:
+        accumulator += min(clock.tick(FPS) / 1000, 0.25)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                running = False
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
+                fire = True
+            elif event.type == pygame.MOUSEMOTION:
+                turn += event.rel[0] * client.player.rotation_speed * 1000
+            elif event.type == pygame.VIDEORESIZE:
+                display.update(event.w, event.h)
+                text_cache.clear()
+                screen = pygame.display.set_mode((display.width, display.height), pygame.RESIZABLE)
+
+        while accumulator >= interval:
+            buttons = keys_action(pygame.key.get_pressed()) | (FIRE if fire else 0)
+            client.send_input(buttons, turn)
+            turn = 0.0
+            fire = False
+            accumulator -= interval
+        client.poll()
+
+        draw_frame(screen, client, display)
+        pygame.display.flip()
+
+    client.close()
+    pygame.quit()
+
+def parse_address(text):
+    host, _, port = text.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Authoritative UDP server and client")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="run a headless server")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=7777)
+    serve.add_argument("--tick-rate", type=int, default=30)
+    serve.add_argument("--enemies", type=int, default=None)
+    serve.add_argument("--level", default=None)
+    connect = commands.add_parser("play", help="join a server with a game window")
+    connect.add_argument("address", help="host:port")
+    connect.add_argument("--level", default=None, help="the level file the server runs")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        if args.level:
+            load_level(args.level)
+            visibility.ensure(VisibilityTable.cache_path_for(args.level))
+        server = Server(args.host, args.port, args.tick_rate, args.enemies)
+        print(f"serving on {server.address[0]}:{server.address[1]} at {args.tick_rate} Hz")
+        try:
+            server.run()
+        except KeyboardInterrupt:
+            pass
+        print(server.stats())
+    else:
+        play(parse_address(args.address), args.level)
+
+if __name__ == "__main__":
+    main_cli()
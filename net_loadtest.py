@@ -0,0 +1,129 @@
+import argparse
+import json
+import multiprocessing
+import time
+
+import numpy as np
+
+import net
+from fps.map import load_level, make_map, set_map, spawn_layout
+from fps.input import BACKWARD, FORWARD, NUM_ACTIONS
+
+def setup_level(level_path, map_size, seed):
+    if level_path:
+        load_level(level_path)
+    else:
+        grid = make_map(map_size, seed)
+        set_map(grid, spawn_layout(grid, 0, seed))
+
+def serve(connection, level_path, map_size, seed, tick_rate, enemies, duration):
+    setup_level(level_path, map_size, seed)
+    server = net.Server(tick_rate=tick_rate, enemy_count=enemies, seed=seed)
+    connection.send(server.address)
+    # Answer HELLOs until every client is in, then start ticking.
+    while not connection.poll(0.001):
+        server.poll()
+    connection.recv()
+    server.run(duration)
+    connection.send(server.stats())
+    server.close()
+
+def run(clients=32, seconds=10.0, tick_rate=30, enemies=64, map_size=48, seed=0, level_path=None):
+    setup_level(level_path, map_size, seed)
+    context = multiprocessing.get_context("spawn")
+    parent, child = context.Pipe()
+    # A little longer than the client run so the server outlives the last input.
+    process = context.Process(target=serve, args=(child, level_path, map_size, seed, tick_rate, enemies, seconds + 1.0))
+    process.start()
+    address = parent.recv()
+
+    bots = [net.Client(address) for _ in range(clients)]
+    for bot in bots:
+        if not bot.connect():
+            raise RuntimeError(f"client could not connect to {address}")
+    parent.send("start")
+
+    rng = np.random.default_rng(seed)
+    interval = 1 / tick_rate
+    corrections = []
+    deadline = start = time.perf_counter()
+    while deadline - start < seconds:
+        # Bots walk forward, turn at random, and fire now and then.
+        buttons = (rng.integers(0, NUM_ACTIONS, clients) & ~BACKWARD) | FORWARD
+        turns = rng.normal(0, 40, clients)
+        for bot, action, turn in zip(bots, buttons.tolist(), turns.tolist()):
+            bot.send_input(action, turn)
+        for bot in bots:
+            bot.poll()
+            corrections.append(bot.correction)
+        deadline += interval
+        delay = deadline - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    elapsed = time.perf_counter() - start
+    for bot in bots:
+        bot.poll()
+
+    stats = parent.recv()
+    process.join()
+    for bot in bots:
+        bot.close()
+
+    received = np.array([bot.bytes_received for bot in bots], dtype=np.float64)
+    sent = np.array([bot.bytes_sent for bot in bots], dtype=np.float64)
+    snapshots = sum(bot.snapshots_received for bot in bots)
+    corrections = np.array(corrections)
+    return {
+        "params": {
+            "clients": clients,
+            "seconds": seconds,
+            "tick_rate": tick_rate,
+            "enemies": enemies,
+            "map_size": None if level_path else map_size,
+            "seed": seed,
+            "level": level_path,
+        },
+        "server": stats,
+        "bandwidth": {
+            "down_bytes_per_client_per_second": float(received.mean() / elapsed),
+            "down_max_bytes_per_client_per_second": float(received.max() / elapsed),
+            "up_bytes_per_client_per_second": float(sent.mean() / elapsed),
+            "mean_snapshot_bytes": float(received.sum() / max(snapshots, 1)),
+            "snapshots_received": snapshots,
+            "full_snapshots": stats["full_snapshots"],
+        },
+        "prediction": {
+            "mean_correction": float(corrections.mean()) if corrections.size else 0.0,
+            "max_correction": float(corrections.max()) if corrections.size else 0.0,
+        },
+    }
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Localhost load test for the UDP server")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--tick-rate", type=int, default=30)
+    parser.add_argument("--enemies", type=int, default=64)
+    parser.add_argument("--map-size", type=int, default=48)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--level", default=None)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    result = run(args.clients, args.seconds, args.tick_rate, args.enemies, args.map_size, args.seed, args.level)
+    server = result["server"]
+    bandwidth = result["bandwidth"]
+    print(f"server tick     {server['tick_mean_ms']:.2f} ms mean  {server['tick_p95_ms']:.2f} ms p95  "
+          f"{server['tick_max_ms']:.2f} ms max  ({server['ticks']} ticks, {server['clients']} clients)")
+    print(f"downstream      {bandwidth['down_bytes_per_client_per_second'] / 1024:.1f} KiB/s per client  "
+          f"({bandwidth['mean_snapshot_bytes']:.0f} B per snapshot, {bandwidth['full_snapshots']} full)")
+    print(f"upstream        {bandwidth['up_bytes_per_client_per_second'] / 1024:.1f} KiB/s per client")
+    print(f"correction      {result['prediction']['mean_correction']:.4f} tiles mean  "
+          f"{result['prediction']['max_correction']:.4f} max")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main_cli()
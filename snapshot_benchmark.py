@@ -0,0 +1,70 @@
+import argparse
+import json
+import time
+
+from fps.constants import REWIND_SECONDS, TICK_RATE
+from fps.map import make_map, set_map, spawn_layout
+from fps.simulation import EDIT_BYTES, ENEMY_BYTES, WORLD_HEADER, SnapshotRing, pack_world, simulate, unpack_world
+
+def time_call(function, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats * 1e6
+
+def run_count(enemy_count, map_size, seed, repeats, ring_ticks):
+    grid = make_map(map_size, seed)
+    set_map(grid, spawn_layout(grid, enemy_count, seed))
+    simulation = simulate(10)
+    ring = SnapshotRing(ring_ticks, max_enemies=enemy_count)
+    packed = pack_world(simulation)
+
+    return {
+        "enemies": enemy_count,
+        "snapshot_bytes": len(packed),
+        "bytes_per_enemy": ENEMY_BYTES,
+        "ring_slots": ring_ticks,
+        "ring_bytes": ring.nbytes,
+        "pack_us": time_call(lambda: pack_world(simulation, ring.slots[0]), repeats),
+        "unpack_us": time_call(lambda: unpack_world(packed, simulation), repeats),
+        "ring_push_us": time_call(lambda: ring.push(simulation), repeats),
+        "tick_us": time_call(simulation.step, repeats) if not simulation.finished else None,
+    }
+
+def run(counts=(100, 1000, 5000, 20000), map_size=256, seed=0, repeats=200, ring_ticks=None):
+    ring_ticks = ring_ticks or REWIND_SECONDS * TICK_RATE
+    return {
+        "params": {
+            "map_size": map_size,
+            "seed": seed,
+            "repeats": repeats,
+            "header_bytes": WORLD_HEADER.size,
+            "bytes_per_enemy": ENEMY_BYTES,
+            "bytes_per_edit": EDIT_BYTES,
+        },
+        "results": [run_count(count, map_size, seed, repeats, ring_ticks) for count in counts],
+    }
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="World snapshot and rewind ring benchmark")
+    parser.add_argument("--counts", type=int, nargs="+", default=[100, 1000, 5000, 20000])
+    parser.add_argument("--map-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--ring-ticks", type=int, default=None)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    result = run(args.counts, args.map_size, args.seed, args.repeats, args.ring_ticks)
+    for stats in result["results"]:
+        tick = f"{stats['tick_us']:9.1f}" if stats["tick_us"] is not None else "      n/a"
+        print(f"{stats['enemies']:6d} enemies  {stats['snapshot_bytes']:8d} B/snapshot  "
+              f"ring {stats['ring_bytes'] / 2**20:7.1f} MiB  pack {stats['pack_us']:7.1f} us  "
+              f"unpack {stats['unpack_us']:7.1f} us  push {stats['ring_push_us']:7.1f} us  tick {tick} us")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Each sample runs in a fresh interpreter so module caches and SDL state
+# from one measurement never leak into the next.
+STARTUP = """
+import json, sys, time
+start = time.perf_counter()
+import fps.map, fps.input, fps.raycaster, fps.entities, fps.simulation
+logic = time.perf_counter()
+pygame_on_import = 'pygame' in sys.modules
+from fps import app, map as game_map
+imported = time.perf_counter()
+app.init()
+initialized = time.perf_counter()
+
+import pygame
+from fps.entities import EnemyPool, Player
+from fps.raycaster import VisibilityTable, visibility
+from fps.rendering import DisplayConfig, render_3d
+from fps.ui import draw_hud, draw_minimap
+
+level_path = sys.argv[1] or None
+if level_path:
+    game_map.load_level(level_path)
+display = DisplayConfig()
+screen = pygame.display.set_mode((display.width, display.height))
+player = Player(*game_map.level.player_start)
+enemies = EnemyPool.from_positions(game_map.level.spawns)
+visibility.ensure(VisibilityTable.cache_path_for(level_path) if level_path else None)
+render_3d(screen, player, enemies, display)
+draw_minimap(screen, player, enemies, display)
+draw_hud(screen, player, enemies, display)
+pygame.display.flip()
+frame = time.perf_counter()
+
+print(json.dumps({
+    "logic_import_ms": (logic - start) * 1000,
+    "app_import_ms": (imported - logic) * 1000,
+    "init_ms": (initialized - imported) * 1000,
+    "first_frame_ms": (frame - initialized) * 1000,
+    "pvs_build_ms": visibility.build_ms,
+    "total_ms": (frame - start) * 1000,
+    "pygame_on_logic_import": pygame_on_import,
+    "subsystems": {"display": pygame.display.get_init(), "font": pygame.font.get_init(),
+                   "mixer": bool(pygame.mixer.get_init()), "joystick": pygame.joystick.get_init()},
+}))
+"""
+
+# What the old `pygame.init()` at import time cost on its own.
+FULL_INIT = """
+import json, time
+import pygame
+start = time.perf_counter()
+pygame.init()
+print(json.dumps({"full_init_ms": (time.perf_counter() - start) * 1000}))
+"""
+
+def sample(script, *args):
+    env = dict(os.environ)
+    env.setdefault("SDL_VIDEODRIVER", "dummy")
+    env.setdefault("SDL_AUDIODRIVER", "dummy")
+    env["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", script, *args], env=env, check=True,
+                            capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    result = json.loads(output.splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+def summarize(samples, keys):
+    return {key: {"median_ms": statistics.median(s[key] for s in samples),
+                  "max_ms": max(s[key] for s in samples)} for key in keys}
+
+def run(repeats=10, level_path=None):
+    startup = [sample(STARTUP, level_path or "") for _ in range(repeats)]
+    full_init = [sample(FULL_INIT) for _ in range(repeats)]
+    return {
+        "params": {
+            "repeats": repeats,
+            "level": level_path,
+            "python": sys.version.split()[0],
+        },
+        "startup": summarize(startup, ["logic_import_ms", "app_import_ms", "init_ms", "first_frame_ms",
+                                       "pvs_build_ms", "total_ms", "process_ms"]),
+        "pygame_on_logic_import": any(s["pygame_on_logic_import"] for s in startup),
+        "subsystems": startup[-1]["subsystems"],
+        "reference": summarize(full_init, ["full_init_ms"]),
+    }
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Import, init and first-frame cost of a cold start")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--level", default=None)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    result = run(args.repeats, args.level)
+    for stage, stats in result["startup"].items():
+        print(f"{stage:16s} median {stats['median_ms']:8.2f} ms  max {stats['max_ms']:8.2f} ms")
+    reference = result["reference"]["full_init_ms"]
+    print(f"{'pygame.init()':16s} median {reference['median_ms']:8.2f} ms  max {reference['max_ms']:8.2f} ms  (reference)")
+    print(f"pygame loaded by logic imports: {result['pygame_on_logic_import']}")
+    print("subsystems up after first frame: "
+          + ", ".join(name for name, up in result["subsystems"].items() if up))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main_cli()
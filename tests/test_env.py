@@ -0,0 +1,20 @@
+import numpy as np
+
+from env import VectorEnv
+from fps import map as game_map
+from fps.map import make_map, set_map, spawn_layout
+
+def test_flow_fields_stay_within_their_bound():
+    grid = make_map(16, 0)
+    set_map(grid, spawn_layout(grid, 4, 0))
+    vector = VectorEnv(32, max_flow_fields=4)
+    vector.reset()
+
+    # Every instance's player on its own tile, so each asks for a different field.
+    floor_y, floor_x = np.nonzero(game_map.level.to_array() == 0)
+    vector.x[:] = floor_x[:32] + 0.5
+    vector.y[:] = floor_y[:32] + 0.5
+    for _ in range(3):
+        vector.step(np.zeros(32, dtype=np.int64))
+        assert len(vector.flow_fields) <= 4
+    assert len(vector.flow_fields) == 4
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from fps.map import Level, make_map, spawn_layout
+
+def test_spawns_take_distinct_free_tiles():
+    grid = np.asarray(make_map(16, 0))
+    spawns = spawn_layout(grid, 100, 0)
+    assert len(set(spawns)) == len(spawns) == 100
+    assert all(grid[int(y), int(x)] == 0 for x, y in spawns)
+
+    # More enemies than free tiles puts one on every tile but the player's.
+    free = int((grid == 0).sum()) - 1
+    assert len(set(spawn_layout(grid, free + 50, 0))) == free
+
+@pytest.mark.parametrize("chunk", [0, 10, 8])
+def test_saved_level_reopens_the_same(tmp_path, chunk):
+    # 30x20 so a chunk of 8 leaves partial chunks on both axes.
+    grid = np.asarray(make_map(32, 1))[:20, :30]
+    spawns = spawn_layout(grid, 12, 1)
+    level = Level.from_rows(grid, spawns, player_start=(2.5, 3.5), metadata={"name": "test"})
+    path = str(tmp_path / "level.lvl")
+    level.save(path, chunk=chunk)
+
+    reopened = Level.open(path)
+    assert (reopened.width, reopened.height, reopened.chunk) == (30, 20, chunk)
+    assert (reopened.to_array() == grid).all()
+    ys, xs = np.mgrid[0:20, 0:30]
+    assert (reopened.tiles(xs.ravel(), ys.ravel()) == grid.ravel()).all()
+    assert all(reopened.tile(x, y) == grid[y, x] for x, y in [(0, 0), (29, 19), (17, 9), (8, 8)])
+    assert reopened.spawns == spawns
+    assert reopened.player_start == (2.5, 3.5)
+    assert reopened.metadata == {"name": "test"}
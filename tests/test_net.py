@@ -0,0 +1,80 @@
+import threading
+import time
+
+import net
+from fps.input import FORWARD
+from fps.map import make_map, set_map, spawn_layout
+
+def test_client_renders_a_snapshot():
+    import pygame
+    from fps.app import init
+    from fps.rendering import DisplayConfig
+
+    grid = make_map(16, 0)
+    set_map(grid, spawn_layout(grid, 0, 0))
+    server = net.Server(enemy_count=8)
+    client = net.Client(server.address)
+    ticking = threading.Thread(target=lambda: [server.step() or time.sleep(0.01) for _ in range(30)])
+    ticking.start()
+    try:
+        assert client.connect()
+    finally:
+        ticking.join()
+
+    for _ in range(5):
+        client.send_input(FORWARD, 0.0)
+        server.step()
+        client.poll()
+    assert client.snapshots
+    assert client.entities()
+
+    init()
+    display = DisplayConfig()
+    screen = pygame.display.set_mode((display.width, display.height))
+    net.draw_frame(screen, client, display)
+    pygame.display.flip()
+
+    client.close()
+    server.close()
+
+def test_malformed_packets_are_dropped():
+    import socket
+    import struct
+
+    grid = make_map(16, 0)
+    set_map(grid, spawn_layout(grid, 0, 0))
+    server = net.Server(enemy_count=4)
+    client = net.Client(server.address)
+    ticking = threading.Thread(target=lambda: [server.step() or time.sleep(0.01) for _ in range(30)])
+    ticking.start()
+    try:
+        assert client.connect()
+    finally:
+        ticking.join()
+
+    # A header promising three inputs with none behind it.
+    client.socket.sendto(net.INPUT_HEADER.pack(net.INPUT, client.id, 0, 3), server.address)
+    time.sleep(0.05)
+    server.step()
+    assert client.id in server.clients
+    client.poll()
+    latest = client.latest_tick
+
+    # A snapshot with an unknown field mask, then one cut short of its counts.
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    header = net.SNAPSHOT_HEADER.pack(net.SNAPSHOT, 1 << 30, 0, 0, 1.0, 1.0, 0.0, 100, 10, 0, 1)
+    sender.sendto(header + struct.pack('<HB', 1, 0xFF), client.socket.getsockname())
+    sender.sendto(net.SNAPSHOT_HEADER.pack(net.SNAPSHOT, (1 << 30) + 1, 0, 0, 1.0, 1.0, 0.0, 100, 10, 5, 5),
+                  client.socket.getsockname())
+    sender.close()
+    time.sleep(0.05)
+    client.poll()
+    assert client.latest_tick == latest
+
+    client.send_input(FORWARD, 0.0)
+    server.step()
+    client.poll()
+    assert client.latest_tick > latest
+
+    client.close()
+    server.close()
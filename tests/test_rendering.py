@@ -0,0 +1,42 @@
+import copy
+
+import numpy as np
+import pygame
+
+from fps import map as game_map
+from fps.app import init
+from fps.entities import Player
+from fps.map import make_map, set_map, set_tile, spawn_layout
+from fps.rendering import DisplayConfig, close_render_pools, render_walls_numpy, render_walls_parallel
+
+def test_parallel_walls_match_single_process():
+    grid = make_map(24, 2)
+    set_map(grid, spawn_layout(grid, 0, 2))
+    init()
+    pygame.display.set_mode((8, 8))
+    player = Player(*game_map.level.player_start)
+    player.angle = 0.7
+
+    display = DisplayConfig()
+    display.render_mode = "parallel"
+    display.render_workers = 3
+    try:
+        for textured in (False, True):
+            for width, height in ((803, 600), (400, 301)):
+                display.update(width, height)
+                display.textured = textured
+                single = pygame.Surface((width, height), 0, 32)
+                parallel = pygame.Surface((width, height), 0, 32)
+                depth = render_walls_numpy(single, player, copy.copy(display))
+                assert (render_walls_parallel(parallel, player, display) == depth).all()
+                assert (pygame.surfarray.array2d(single) == pygame.surfarray.array2d(parallel)).all()
+
+        # Edits reach the workers' copy of the level.
+        before = pygame.surfarray.array2d(single)
+        set_tile(int(player.x + np.cos(player.angle)), int(player.y + np.sin(player.angle)), 1)
+        render_walls_numpy(single, player, display)
+        render_walls_parallel(parallel, player, display)
+        assert (pygame.surfarray.array2d(single) != before).any()
+        assert (pygame.surfarray.array2d(single) == pygame.surfarray.array2d(parallel)).all()
+    finally:
+        close_render_pools()
@@ -0,0 +1,29 @@
+import numpy as np
+
+from fps import map as game_map
+from fps.entities import AIScheduler, EnemyPool, Player
+from fps.map import make_map, set_map, spawn_layout
+from fps.raycaster import visibility
+
+def test_overloaded_budget_still_reaches_every_enemy():
+    grid = make_map(64, 0)
+    set_map(grid, spawn_layout(grid, 3000, 0))
+    visibility.ensure()
+    player = Player(*game_map.level.player_start)
+    enemies = EnemyPool.from_positions(game_map.level.spawns)
+    # Far less than one update's worth of time, so only the quota gets the lower tiers through.
+    scheduler = AIScheduler(budget_ms=1e-6, max_catchup=16)
+
+    last_update = np.zeros(len(enemies), dtype=np.int64)
+    worst_wait = 0
+    for tick in range(1, 101):
+        player.health = 100
+        enemies.begin_tick()
+        scheduler.step(enemies, player)
+        alive = enemies.alive_indices()
+        assert scheduler.pending[alive].max() <= scheduler.max_catchup
+        updated = alive[scheduler.pending[alive] == 0]
+        worst_wait = max(worst_wait, int((tick - last_update[alive]).max()))
+        last_update[updated] = tick
+    assert sum(scheduler.totals[1:]) > 0
+    assert worst_wait <= scheduler.max_catchup
@@ -0,0 +1,52 @@
+import pytest
+
+from fps import map as game_map
+from fps.entities import AIScheduler, EnemyPool, Player
+from fps.input import K_a, K_w, KeyState
+from fps.map import make_map, set_map, spawn_layout
+from fps.simulation import Simulation, SnapshotRing, pack_world, unpack_world, world_size
+
+def make_simulation(enemy_count, seed=0, scheduler=None):
+    grid = make_map(24, seed)
+    set_map(grid, spawn_layout(grid, enemy_count, seed))
+    return Simulation(Player(*game_map.level.player_start), EnemyPool.from_positions(game_map.level.spawns),
+                      scheduler=scheduler)
+
+def test_truncated_snapshot_is_rejected_untouched():
+    simulation = make_simulation(20)
+    packed = pack_world(simulation).tobytes()
+    simulation.simulate(5)
+    before = pack_world(simulation).tobytes()
+    for size in (10, len(packed) - 1):
+        with pytest.raises(ValueError):
+            unpack_world(packed[:size], simulation)
+        assert pack_world(simulation).tobytes() == before
+
+def test_replay_from_snapshot_matches_with_scheduler():
+    simulation = make_simulation(40, 1, AIScheduler())
+    keys = [KeyState([K_w] if tick % 50 < 30 else [K_a]) for tick in range(120)]
+    simulation.simulate(20, lambda sim: keys[sim.tick])
+    packed = pack_world(simulation).tobytes()
+    simulation.simulate(60, lambda sim: keys[sim.tick])
+    first = pack_world(simulation).tobytes()
+
+    unpack_world(packed, simulation)
+    simulation.simulate(60, lambda sim: keys[sim.tick])
+    assert pack_world(simulation).tobytes() == first
+
+def test_ring_grows_for_bigger_worlds_and_keeps_history():
+    small = make_simulation(4)
+    ring = SnapshotRing(8, max_enemies=4)
+    small.simulate(1)
+    ring.push(small)
+    big = Simulation(small.player, EnemyPool.from_positions(game_map.level.spawns * 10))
+    ring.push(big)
+    assert ring.max_enemies == 40 and len(ring) == 2
+    ring.pop(small)
+    assert small.enemies.count == 4 and small.tick == 1
+
+def test_ring_capacity_follows_memory_cap():
+    ring = SnapshotRing(600, max_enemies=20000, max_bytes=16 << 20)
+    assert ring.nbytes <= (16 << 20) + ring.ticks.nbytes
+    assert 2 <= ring.capacity < 600
+    assert ring.slot_size >= world_size(20000, 64)
@@ -0,0 +1,62 @@
+import numpy as np
+
+from fps import map as game_map
+from fps import raycaster
+from fps.map import make_map, set_map, set_tile, spawn_layout
+from fps.raycaster import VisibilityTable, segments_clear
+
+def load_map(size, seed):
+    grid = make_map(size, seed)
+    set_map(grid, spawn_layout(grid, 0, seed))
+    return grid
+
+def test_table_keeps_every_sampled_sight_line():
+    load_map(24, 3)
+    table = VisibilityTable()
+    table.ensure()
+    banded = VisibilityTable(band_tiles=24 * 3)
+    banded.ensure()
+    assert (banded.bits == table.bits).all()
+
+    walkable_y, walkable_x = np.nonzero(table.tile_index >= 0)
+    source, target = np.meshgrid(np.arange(len(walkable_x)), np.arange(len(walkable_x)), indexing="ij")
+    offset_x = walkable_x[target] - walkable_x[source]
+    offset_y = walkable_y[target] - walkable_y[source]
+    near = (np.abs(offset_x) <= table.radius) & (np.abs(offset_y) <= table.radius)
+    source, offset_x, offset_y = source[near], offset_x[near], offset_y[near]
+    x = walkable_x[source]
+    y = walkable_y[source]
+    bit = (offset_y + table.radius) * table.window + offset_x + table.radius
+    visible = (table.bits[table.tile_index[y, x], bit >> 3] & (128 >> (bit & 7))) != 0
+
+    for source_x, source_y in table.SAMPLES:
+        for target_x, target_y in table.SAMPLES:
+            clear = segments_clear(x + source_x, y + source_y, x + offset_x + target_x, y + offset_y + target_y)
+            assert visible[clear].all()
+
+def test_cached_table_matches_build(tmp_path):
+    load_map(24, 4)
+    path = str(tmp_path / "level.pvs.npz")
+    built = VisibilityTable()
+    built.ensure(path)
+    cached = VisibilityTable()
+    cached.ensure(path)
+    assert built.builds == 1 and cached.builds == 0
+    assert (cached.bits == built.bits).all()
+
+def test_edits_match_a_fresh_table(monkeypatch):
+    grid = load_map(24, 5)
+    table = VisibilityTable()
+    monkeypatch.setattr(raycaster, "visibility", table)
+    table.ensure()
+
+    walls_y, walls_x = np.nonzero(np.array(grid)[1:-1, 1:-1] == 1)
+    set_tile(int(walls_x[0]) + 1, int(walls_y[0]) + 1, 0)
+    set_tile(3, 3, 1)
+    assert table.version == game_map.level.version
+
+    fresh = VisibilityTable()
+    fresh.ensure()
+    walkable_y, walkable_x = np.nonzero(fresh.tile_index >= 0)
+    assert (table.bits[table.tile_index[walkable_y, walkable_x]]
+            == fresh.bits[fresh.tile_index[walkable_y, walkable_x]]).all()